@@ -1,4 +1,7 @@
-from src.agents import RadioactivityAgent, RobotAgent, WasteAgent
+import solara
+from matplotlib.colors import ListedColormap
+
+from src.agents import RobotAgent, WasteAgent
 from src.model import WasteRetrievalModel
 
 from mesa.experimental.devs import ABMSimulator
@@ -8,6 +11,7 @@ from mesa.visualization import (
     make_plot_component,
     make_space_component,
 )
+from mesa.visualization.utils import update_counter
 
 radioactivity_colors = ["green", "gold", "red"]
 robot_colors = {"green":"lawngreen",
@@ -23,16 +27,7 @@ def agent_portrayal(agent):
         "size": 25,
     }
 
-    if isinstance(agent, RadioactivityAgent):
-        portrayal["marker"] = "s"
-        portrayal["zorder"] = 0
-        portrayal["size"] = 100
-        if agent.radioactivity != 2:
-            portrayal["color"] = radioactivity_colors[int(3*agent.radioactivity)]
-        else:
-            portrayal["color"] = radioactivity_colors[agent.radioactivity]
-
-    elif isinstance(agent, WasteAgent):
+    if isinstance(agent, WasteAgent):
         portrayal["color"] = waste_colors[agent.color]
         portrayal["marker"] = "v"
         portrayal["zorder"] = 2
@@ -44,6 +39,15 @@ def agent_portrayal(agent):
 
     return portrayal
 
+# the radioactivity field is a property layer of the grid, values >= 1 (disposal cell) are shown red
+propertylayer_portrayal = {
+    "radioactivity": {
+        "colormap": ListedColormap(radioactivity_colors),
+        "vmin": 0,
+        "vmax": 1,
+        "colorbar": False,
+    }
+}
 
 model_params = {
     "seed": {
@@ -78,7 +82,7 @@ def post_process_lines(ax):
 
 
 space_component = make_space_component(
-    agent_portrayal, draw_grid=True, post_process=post_process_space
+    agent_portrayal, propertylayer_portrayal, draw_grid=True, post_process=post_process_space
 )
 
 lineplot_component = make_plot_component(
@@ -86,13 +90,20 @@ lineplot_component = make_plot_component(
     post_process=post_process_lines,
 )
 
+@solara.component
+def StatsPanel(model):
+    update_counter.get()
+    stats = model.stats()
+    solara.Markdown("  \n".join(f"**{name}**: {value:.2f}" if isinstance(value, float) else f"**{name}**: {value}"
+                                for name, value in stats.items()))
+
 # simulator = ABMSimulator()
 model = WasteRetrievalModel()
 # model.running = True
 
 page = SolaraViz(
     model,
-    components=[space_component, lineplot_component],
+    components=[space_component, lineplot_component, StatsPanel],
     model_params=model_params,
     name="Radioactive waste retrieval",
     # simulator=simulator,
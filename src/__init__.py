@@ -16,4 +16,12 @@ License:
    This file is open source and may be freely used and modified,
    provided that proper credit is given to the original authors.
 """
-from .run import Play
\ No newline at end of file
+from .run import Play
+
+
+def __getattr__(name):
+    # imported on first use, importing it with the package makes python -m src.sweep run a second copy of the module
+    if name == "run_sweep":
+        from .sweep import run_sweep
+        return run_sweep
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -17,11 +17,10 @@ License:
 """
 from mesa import Agent
 from .action import Move, Drop, NoneAction
-import numpy as np
-from scipy.ndimage import binary_dilation
-from .variables import color_dict,direction_dict,inv_direction_dict
-from .knowledge_expansion import expand_grid
-import random
+from .variables import color_dict,direction_dict,inv_direction_dict,max_radioactivity_dict,observation_offsets
+from .knowledge_expansion import KnowledgeMap
+from .exploration import ExplorationKernel, FrontierPlanner, closest_cell
+from .sync import ChangeLog, observation_tag
 
 class BaseAgent(Agent):
     def __init__(self,model):
@@ -40,27 +39,26 @@ class BaseAgent(Agent):
         self.model.do(self,action)
     def update_knowledge(self,observation):
         pass
-class RadioactivityAgent(BaseAgent):
-    def __init__(self,model,radioactivity):
-        super().__init__(model)
-        self.radioactivity = radioactivity
-        
 class RobotAgent(BaseAgent):
     def __init__(self,model,color):
         super().__init__(model)
         self.color = color
-        if self.color == "red":
-            self.max_allowed_radioactivity = 2
-        else:
-            self.max_allowed_radioactivity = (color_dict[self.color] + 1) / 3 - 1e-10 
+        self.max_allowed_radioactivity = max_radioactivity_dict[self.color]
         self.knowledge['transporting'] = []
-        self.knowledge['internal_map'] = np.zeros((1,1,6))
-        #on each square of the grid is a tuple (radioactivity, num_agents on that square counting (self), and number of each waste type on that cell (green,yellow,red), age of information
+        self.knowledge['internal_map'] = KnowledgeMap((1,1,6))
+        #on each square of the grid is a tuple (radioactivity, num_agents on that square counting (self), and number of each waste type on that cell (green,yellow,red), step at which it was last seen (-1 if never)
+        #the age of an information is model.current_step - seen, so that nothing has to be updated when time passes
         self.knowledge['internal_map'][0,0,0] = color_dict[color]
         self.knowledge['internal_map'][0,0,1] = 1 #self
+        self.knowledge['internal_map'][0,0,-1] = -1 #filled by the first observation
         self.knowledge['agent_x'] = 0
         self.knowledge['agent_y'] = 0
         self.knowledge['waste_color'] = {}
+        #where the map changed (grid coordinates), and the tag of the last merge with each robot met, to only exchange deltas
+        self.knowledge['changes'] = ChangeLog()
+        self.knowledge['last_sync'] = {}
+        #Team sharing its internal map when the model uses a blackboard, see blackboard.py
+        self.team = None
         self.state = "FINDING_WASTE"
     def deliberate(self):
         #print(self.knowledge['internal_map'].shape)
@@ -72,15 +70,12 @@ class RobotAgent(BaseAgent):
         #if transporting red and is color is red
         if self.color == "red" and len(self.knowledge['transporting']) >= 1 and color_dict[self.knowledge['waste_color'][self.knowledge['transporting'][0]]] >= color_dict[self.color]:
              self.state = "TRANSPORTING"
-        possible_next_cell = []
-        for (x,y) in self.knowledge['last_observation']:
-            if (x,y) != (0,0) and self.get_radioactivity((x + self.knowledge['agent_x'], y + self.knowledge['agent_y'])) <= self.max_allowed_radioactivity:
-                possible_next_cell.append((x,y))
+        possible_next_cell = self.possible_next_cells()
         #WHAT TO DO FOR EACH STATE
         #print(self.state,possible_next_cell,self.color,self.max_allowed_radioactivity)
         if self.state == "FINDING_WASTE" and self.color == "green":
             #print(possible_next_cell)
-            next_cell = random.choice(possible_next_cell)
+            next_cell = self.model.decision_random.choice(possible_next_cell)
             next_cell_direction = inv_direction_dict[next_cell]
             x,y = next_cell
             self.knowledge['agent_x'] += x
@@ -97,7 +92,7 @@ class RobotAgent(BaseAgent):
             #if on the boundary, random walk north and south
             #print(possible_next_cell)
             possible_next_cell_dir_shuffled = [inv_direction_dict[cell] for cell in possible_next_cell]
-            random.shuffle(possible_next_cell_dir_shuffled)
+            self.model.decision_random.shuffle(possible_next_cell_dir_shuffled)
             for dir in possible_next_cell_dir_shuffled:
                 if dir == "NORTH" or dir == "SOUTH":
                     x,y = direction_dict[dir]
@@ -126,32 +121,65 @@ class RobotAgent(BaseAgent):
             return Drop(self.knowledge['transporting'][0])
 
     def update_knowledge(self,observation):
-        for (x,y) in observation:
-            if not self.in_map((x + self.knowledge['agent_x'],y + self.knowledge['agent_y'])) and abs(x) + abs(y) == 1:  #second condition makes sure that its N,S,W,E
-                self.knowledge['internal_map'] = expand_grid(self.knowledge['internal_map'],(x,y))
+        '''
+        observation is (cells,(x_min,x_max,y_min,y_max)): the block of model.cell_layers around the robot clipped to the grid
+        (radioactivity, robots, green, yellow and red wastes lying there), and its bounds as offsets from the robot.
+        '''
+        cells,(x_min,x_max,y_min,y_max) = observation
+        if self.team is not None:
+            #teammates may have expanded the shared map since our last step
+            self.knowledge['agent_x'],self.knowledge['agent_y'] = self.team.locate(self.pos)
+        for (x,y) in ((-1,0),(0,-1),(0,1),(1,0)): #N,S,W,E
+            if x_min <= x < x_max and y_min <= y < y_max and not self.in_map((x + self.knowledge['agent_x'],y + self.knowledge['agent_y'])):
+                self.knowledge['internal_map'].expand((x,y))
                 self.knowledge['agent_x'] += max(0,-x)
                 self.knowledge['agent_y'] += max(0,-y)
         #finish updating knowledge
-        #add one age to all squares except fog of war
-        mask = self.knowledge['internal_map'][:, :, -1] != -1
-        self.knowledge['internal_map'][:, :, -1][mask] += 1 
-        print(self.knowledge["internal_map"][:,:,-1])
-        for (x,y) in observation:
-            #first, reset information of that square
-            self.knowledge['internal_map'][x + self.knowledge['agent_x'],y + self.knowledge['agent_y'],:] = 0
-            #fill in knowledge
-            for agent in observation[(x,y)]:
-                if isinstance(agent,RadioactivityAgent):
-                    self.knowledge['internal_map'][x + self.knowledge['agent_x'],y + self.knowledge['agent_y'],0] = agent.radioactivity
+        x_agent,y_agent = self.knowledge['agent_x'],self.knowledge['agent_y']
+        block = self.knowledge['internal_map'][x_agent + x_min:x_agent + x_max,y_agent + y_min:y_agent + y_max]
+        #radioactivity is static, it is only read the first time a cell is seen
+        first_seen = block[:,:,-1] == -1
+        block[first_seen,0] = cells[first_seen,0]
+        block[:,:,1:5] = cells[:,:,1:]
+        block[:,:,-1] = self.model.current_step
+        for waste_id in self.knowledge['transporting']:
+            self.knowledge['waste_color'][waste_id] = self.model.get_agent_by_id(waste_id).color
+        self.knowledge['last_observation'] = (x_min,x_max,y_min,y_max)
+        x_pos,y_pos = self.pos
+        self.knowledge['changes'].record(observation_tag(self.model.current_step),
+                                         max(x_pos - 1,0),min(x_pos + 2,self.model.width),max(y_pos - 1,0),min(y_pos + 2,self.model.height))
+    def possible_next_cells(self):
+        '''observed neighbouring cells (relative offsets) that this robot is allowed to walk on'''
+        passable = self.model.passable[self.color]
+        x_agent,y_agent = self.pos
+        x_min,x_max,y_min,y_max = self.knowledge['last_observation']
+        return [(x,y) for (x,y) in observation_offsets if x_min <= x < x_max and y_min <= y < y_max
+                and (x,y) != (0,0) and passable[x + x_agent,y + y_agent]]
 
-                if isinstance(agent,RobotAgent):
-                    self.knowledge['internal_map'][x + self.knowledge['agent_x'],y + self.knowledge['agent_y'],1] +=1
+    def map_origin(self):
+        '''grid position of the cell (0,0) of the internal map'''
+        return (self.pos[0] - self.knowledge['agent_x'],self.pos[1] - self.knowledge['agent_y'])
+
+    def merge_knowledge(self,merged,x_grid,y_grid,tag):
+        '''
+        Write the cells of merged, whose cell (0,0) is at grid position (x_grid,y_grid), that were seen later than what the
+        internal map knows, the map being expanded to cover them. The written cells are recorded in the change log under tag.
+        '''
+        x_origin,y_origin = self.map_origin()
+        (shift_x,shift_y),box = self.knowledge['internal_map'].merge(merged,x_grid - x_origin,y_grid - y_origin)
+        self.knowledge['agent_x'] += shift_x
+        self.knowledge['agent_y'] += shift_y
+        if box is None:
+            return
+        x_min,x_max,y_min,y_max = box
+        x_origin,y_origin = self.map_origin()
+        self.knowledge['changes'].record(tag,x_origin + x_min,x_origin + x_max,y_origin + y_min,y_origin + y_max)
+        self.knowledge_changed(x_min,x_max,y_min,y_max)
+
+    def knowledge_changed(self,x_min,x_max,y_min,y_max):
+        '''Cells [x_min,x_max[ x [y_min,y_max[ of the internal map have been rewritten from outside the robot'''
+        pass
 
-                if isinstance(agent,WasteAgent):
-                    if not (agent.picked_up or agent.arrived): #don't notice wastes that are picked up
-                        self.knowledge['internal_map'][x + self.knowledge['agent_x'],y + self.knowledge['agent_y'],2 + color_dict[agent.color]] += 1 
-                    self.knowledge['waste_color'][agent.unique_id] = agent.color
-        self.knowledge['last_observation'] = observation
     def in_map(self,square):
         x,y = square
         len_x,len_y = self.knowledge['internal_map'].shape[:2]
@@ -182,7 +210,22 @@ class WasteAgent(BaseAgent):
 class RefinedAgent(RobotAgent):
     def __init__(self,*args,**kwargs):
         super().__init__(*args,**kwargs)
+        self.explorer = ExplorationKernel(self.color)
+        self.planner = FrontierPlanner(self.color,self.max_allowed_radioactivity)
+
+    def update_knowledge(self,observation):
+        super().update_knowledge(observation)
+        #only the observed 3x3 block around the robot changed
+        x_agent,y_agent = self.knowledge['agent_x'],self.knowledge['agent_y']
+        self.knowledge_changed(x_agent - 1,x_agent + 2,y_agent - 1,y_agent + 2)
 
+    def knowledge_changed(self,x_min,x_max,y_min,y_max):
+        if self.team is not None:
+            #the kernels of the other colors of the team read the same map
+            self.team.update_explorers(x_min,x_max,y_min,y_max)
+        else:
+            self.explorer.update(self.knowledge['internal_map'],x_min,x_max,y_min,y_max)
+        self.planner.observe(self.knowledge['internal_map'],x_min,x_max,y_min,y_max)
 
     def deliberate(self):
         ''' What should the agent do (what action) depending on self.knowledge'''
@@ -193,91 +236,45 @@ class RefinedAgent(RobotAgent):
         #if transporting red and is color is red
         if self.color == "red" and len(self.knowledge['transporting']) >= 1 and color_dict[self.knowledge['waste_color'][self.knowledge['transporting'][0]]] >= color_dict[self.color]:
              self.state = "TRANSPORTING"
-        possible_next_cell = []
-        for (x,y) in self.knowledge['last_observation']:
-            if (x,y) != (0,0) and self.get_radioactivity((x + self.knowledge['agent_x'], y + self.knowledge['agent_y'])) <= self.max_allowed_radioactivity:
-                possible_next_cell.append((x,y))
+        possible_next_cell = self.possible_next_cells()
         #WHAT TO DO FOR EACH STATE
         #print(self.state,possible_next_cell,self.color,self.max_allowed_radioactivity)
         if self.state == "FINDING_WASTE":
             #if a waste of color is available in knowledge map, go get it.
             #Otherwise, explore.
 
-            waste_map_agent_color = self.knowledge["internal_map"][:,:,2 + color_dict[self.color]]
-            candidate_squares = (waste_map_agent_color > 0)
-            #print(candidate_squares)
-            if candidate_squares.any():
-                #there is a waste in sight. Go for it !
-                coordinates = np.argwhere(candidate_squares)
-                # Convert to list of tuples (x, y)
-                coordinates_list = [tuple(coord) for coord in coordinates]
-                x_agent,y_agent = self.knowledge['agent_x'],self.knowledge['agent_y']
-                coordinates_list = [(x-x_agent,y-y_agent) for (x,y) in coordinates_list]
-                distances = [x*x + y*y for (x,y) in coordinates_list]
-                closest = min(enumerate(distances), key=lambda x: x[1])[0]
-                target_cell = coordinates_list[closest]
-                x,y = self.normalize_direction(target_cell)
-                target_dir = inv_direction_dict[(x,y)]
-                self.knowledge['agent_x'] += int(x)
-                self.knowledge['agent_y'] += int(y)
-                return Move(target_dir)
-            else:
-                #nothing in sight, explore !
-                age_map = self.knowledge['internal_map'][:,:,-1]
-                if self.color == "red":
-                    radioactivities = self.knowledge['internal_map'][:,:,0] >= (color_dict[self.color]/3 + 1e-10)
+            #follow the cached path if it is still valid, otherwise plan a new one
+            internal_map = self.knowledge['internal_map']
+            x_agent,y_agent = self.knowledge['agent_x'],self.knowledge['agent_y']
+            next_cell = self.planner.next_step(internal_map,x_agent,y_agent)
+            if next_cell is None:
+                candidate_squares = internal_map[:,:,2 + color_dict[self.color]] > 0
+                if candidate_squares.any():
+                    #there is a waste in sight. Go for it !
+                    target_cell = closest_cell(candidate_squares,x_agent,y_agent)
+                    planned = self.planner.plan(internal_map,x_agent,y_agent,target_cell,goal_is_waste=True)
                 else:
-                    radioactivities = (self.knowledge['internal_map'][:,:,0] >= (color_dict[self.color]/3 + 1e-10)) & (self.knowledge['internal_map'][:,:,0] <= ((color_dict[self.color] +1)/3 - 1e-10))
-                
-                radioactivities = binary_dilation(radioactivities,structure=np.ones((3, 3)))
-
-                extended_age_map = np.where(radioactivities,age_map,0)
-                if -1 in extended_age_map:
-                    target =-1
-                    coordinates = np.argwhere(extended_age_map == target)
-                    # Convert to list of tuples (x, y)
-                    coordinates_list = [tuple(coord) for coord in coordinates if tuple(coord)!= (self.knowledge['agent_x'],self.knowledge['agent_y'])]
-                    x_agent,y_agent = self.knowledge['agent_x'],self.knowledge['agent_y']
-                    coordinates_list = [(x-x_agent,y-y_agent) for (x,y) in coordinates_list]
-                    distances = [x*x + y*y for (x,y) in coordinates_list]
-                    closest = min(enumerate(distances), key=lambda x: x[1])[0]
-                    target_cell = coordinates_list[closest]
-                    x,y = self.normalize_direction(target_cell)
-                    target_dir = inv_direction_dict[(x,y)]
-                    self.knowledge['agent_x'] += int(x)
-                    self.knowledge['agent_y'] += int(y)
-                    return Move(target_dir)
-                else:
-                    i_indices, j_indices = np.meshgrid(np.arange(age_map.shape[0]), np.arange(age_map.shape[1]), indexing='ij')
-                    distance_map = np.abs(i_indices - self.knowledge['agent_x']) + np.abs(j_indices - self.knowledge['agent_y'])
-                    target = np.max(np.where(radioactivities,age_map-distance_map,-10000))
-                    if target <= 0:
-                        if self.get_radioactivity((self.knowledge['agent_x'],self.knowledge['agent_y'])) < color_dict[self.color]/3 +1e-10: #Si deja sur la frontière, interdiction d'aller plus à gauche
-                            #remove westish from possibilities
-                            possible_next_cell = [(x,y) for (x,y) in possible_next_cell if x>= 0]
-                        x,y = random.sample(possible_next_cell,1)[0]
-                        target_dir = inv_direction_dict[(x,y)]
-                        self.knowledge['agent_x'] += int(x)
-                        self.knowledge['agent_y'] += int(y)
-                        return Move(target_dir) 
-                    else:
-                        coordinates = np.argwhere(age_map-distance_map == target)
-                        # Convert to list of tuples (x, y)
-                        coordinates_list = [tuple(coord) for coord in coordinates if tuple(coord)!= (self.knowledge['agent_x'],self.knowledge['agent_y'])]
-                        x_agent,y_agent = self.knowledge['agent_x'],self.knowledge['agent_y']
-                        coordinates_list = [(x-x_agent,y-y_agent) for (x,y) in coordinates_list]
-                        distances = [x*x + y*y for (x,y) in coordinates_list]
-                        closest = min(enumerate(distances), key=lambda x: x[1])[0]
-                        target_cell = coordinates_list[closest]
-                        x,y = self.normalize_direction(target_cell)
-                        target_dir = inv_direction_dict[(x,y)]
-                        self.knowledge['agent_x'] += int(x)
-                        self.knowledge['agent_y'] += int(y)
-                        return Move(target_dir)
-
-                
+                    planned = False
+                if not planned:
+                    #nothing reachable in sight, explore !
+                    target_cell = self.explorer.target(internal_map,x_agent,y_agent,self.model.current_step)
+                    if target_cell is not None:
+                        planned = self.planner.plan(internal_map,x_agent,y_agent,target_cell,goal_is_waste=False)
+                if planned:
+                    next_cell = self.planner.next_step(internal_map,x_agent,y_agent)
+            if next_cell is None:
+                if self.get_radioactivity((x_agent,y_agent)) < color_dict[self.color]/3 +1e-10: #Si deja sur la frontière, interdiction d'aller plus à gauche
+                    #remove westish from possibilities
+                    possible_next_cell = [(x,y) for (x,y) in possible_next_cell if x>= 0]
+                next_cell = self.model.decision_random.sample(possible_next_cell,1)[0]
+            x,y = next_cell
+            target_dir = inv_direction_dict[(x,y)]
+            self.knowledge['agent_x'] += x
+            self.knowledge['agent_y'] += y
+            return Move(target_dir)
 
         if self.state == "TRANSPORTING":
+            self.planner.clear()
             for next_cell in possible_next_cell:
                 if inv_direction_dict[next_cell] == "EAST":
                     x,y = direction_dict["EAST"]
@@ -295,11 +292,3 @@ class RefinedAgent(RobotAgent):
             self.state = "FINDING_WASTE"
             #print(self.knowledge['transporting'])
             return Drop(self.knowledge['transporting'][0])
-
-
-    def normalize_direction(self,target_cell):
-        x, y = target_cell
-        return (
-            0 if x == 0 else x / abs(x),
-            0 if y == 0 else y / abs(y)
-        )
\ No newline at end of file
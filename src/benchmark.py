@@ -0,0 +1,202 @@
+"""
+  ____  __  __    _              _____    _        __  ____     __
+ / ___||  \/  |  / \            | ____|  / \      |  \/  \ \   / /
+ \___ \| |\/| | / _ \    _____  |  _|   / _ \     | |\/| |\ \ / / 
+  ___) | |  | |/ ___ \  |_____| | |___ / ___ \ _  | |  | | \ V /  
+ |____/|_|  |_/_/   \_\         |_____/_/   \_( ) |_|  |_|  \_/   
+                                              |/                  
+Authors:
+   Maxime Vanderbeken
+   Etienne Andrier
+
+Date : 2025-03-19
+
+License:
+   This file is open source and may be freely used and modified,
+   provided that proper credit is given to the original authors.
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+
+from .model import WasteRetrievalModel
+from .profiler import StepProfiler
+
+STRATEGIES = ["random", "refined", "communication"]
+
+# (width, height, robots per color, green, yellow and red wastes, steps budget)
+SIZES = {
+    "tiny": (30, 30, 1, 12, 0, 0, 2000),
+    "small": (60, 60, 5, 40, 10, 0, 1000),
+    "dense": (30, 30, 3, 150, 60, 20, 1000),
+    "medium": (150, 150, 30, 200, 50, 10, 300),
+    "large": (300, 300, 100, 400, 100, 20, 100),
+}
+
+
+def _scenario(size, strategy, engine="objects"):
+    width, height, robots, green, yellow, red, max_steps = SIZES[size]
+    return {"width": width, "height": height, "num_green": robots, "num_yellow": robots, "num_red": robots,
+            "num_waste_green": green, "num_waste_yellow": yellow, "num_waste_red": red,
+            "strategy": strategy, "engine": engine, "max_steps": max_steps, "seed": 0}
+
+
+# named scenarios, WasteRetrievalModel kwargs, max_steps being the benchmark budget of the run
+SCENARIOS = {f"{size}_{strategy}": _scenario(size, strategy) for size in SIZES for strategy in STRATEGIES}
+SCENARIOS.update({f"{size}_{strategy}_arrays": _scenario(size, strategy, "arrays")
+                  for size in ["medium", "large"] for strategy in ["random", "refined"]})
+
+# metric -> True when higher is better, used by compare
+METRICS = {"steps_per_sec": True, "time_to_threshold": False, "peak_rss": False, "tracemalloc_peak": False}
+
+
+def _run(params, steps=None, profiler=None):
+    '''Build the model of params and step it until it finishes or has done steps steps, returns it'''
+    model = WasteRetrievalModel(**params, profiler=profiler)
+    while not model.finished and (steps is None or model.current_step < steps):
+        model.step()
+    return model
+
+
+def measure(name, memory_steps=20):
+    '''
+    Benchmark one scenario: a timed run (steps/sec, time to reach finish_threshold if it does within the budget,
+    peak RSS of the process) then, if memory_steps, a run of memory_steps steps under tracemalloc giving the peak
+    traced memory and the bytes allocated by each phase of step().
+    '''
+    save_path = tempfile.mkdtemp(prefix="benchmark_")
+    params = {**SCENARIOS[name], "save_path": save_path + "/"}
+    try:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            start = time.perf_counter()
+            model = _run(params)
+            elapsed = time.perf_counter() - start
+            reached = model.calculate_progress() >= model.finish_threshold
+            result = {
+                "params": SCENARIOS[name],
+                "steps": model.current_step,
+                "elapsed": elapsed,
+                "steps_per_sec": model.current_step / elapsed,
+                "steps_to_threshold": model.current_step if reached else None,
+                "time_to_threshold": elapsed if reached else None,
+                "progress": model.calculate_progress(),
+                # ru_maxrss is in kilobytes on linux
+                "peak_rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+            }
+            if memory_steps:
+                tracemalloc.start()
+                profiler = StepProfiler(memory=True)
+                _run(params, memory_steps, profiler)
+                result["tracemalloc_peak"] = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                phases = profiler.to_dataframe()
+                result["phases"] = {row["phase"]: {"allocated": int(row["allocated"]), "retained": int(row["retained"])}
+                                    for _, row in phases.iterrows()}
+    finally:
+        shutil.rmtree(save_path, ignore_errors=True)
+    return result
+
+
+def run_benchmark(names, memory_steps=20, workers=1, progress=print):
+    '''
+    Measure the scenarios of names, each in a fresh worker process so that peak RSS is per scenario.
+    Returns the benchmark as a dict (environment and one result per scenario).
+    '''
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers, max_tasks_per_child=1) as pool:
+        futures = {name: pool.submit(measure, name, memory_steps) for name in names}
+        for name, future in futures.items():
+            results[name] = future.result()
+            if progress is not None:
+                result = results[name]
+                progress(f"{name}: {result['steps']} steps, {result['steps_per_sec']:.1f} steps/s, "
+                         f"peak RSS {result['peak_rss'] / 2**20:.0f} MiB")
+    return {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "results": results,
+    }
+
+
+def compare(baseline, current, tolerance=0.1):
+    '''
+    Compare two benchmarks scenario by scenario, returns a list of (scenario, metric, baseline, current, change, regression).
+    A metric regresses when it gets worse by more than tolerance (relative), or when the baseline reached the
+    threshold and the current run did not.
+    '''
+    rows = []
+    for name in baseline["results"]:
+        if name not in current["results"]:
+            continue
+        for metric, higher_is_better in METRICS.items():
+            old = baseline["results"][name].get(metric)
+            new = current["results"][name].get(metric)
+            if old is None and new is None:
+                continue
+            if old is None or new is None:
+                rows.append((name, metric, old, new, None, new is None))
+                continue
+            change = (new - old) / old if old else 0.0
+            regression = change < -tolerance if higher_is_better else change > tolerance
+            rows.append((name, metric, old, new, change, regression))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark WasteRetrievalModel on named scenarios and compare against baselines.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="list the scenarios")
+    run = commands.add_parser("run", help="run scenarios and save the results as a JSON baseline")
+    run.add_argument("--scenarios", nargs="+", default=None, help="scenario names (default: all)")
+    run.add_argument("--output", default="results/benchmarks/benchmark.json", help="JSON file receiving the results")
+    run.add_argument("--memory_steps", type=int, default=20, help="steps of the tracemalloc run, 0 to skip it")
+    run.add_argument("--workers", type=int, default=1, help="scenarios measured in parallel (1 for stable timings)")
+    cmp = commands.add_parser("compare", help="compare two JSON results, exit with 1 on regression")
+    cmp.add_argument("baseline")
+    cmp.add_argument("current")
+    cmp.add_argument("--tolerance", type=float, default=0.1, help="relative change tolerated before flagging a regression")
+    args = parser.parse_args(argv)
+
+    if args.command == "list":
+        for name, params in SCENARIOS.items():
+            print(f"{name}: {params}")
+        return 0
+
+    if args.command == "run":
+        names = args.scenarios or list(SCENARIOS)
+        unknown = [name for name in names if name not in SCENARIOS]
+        if unknown:
+            parser.error(f"unknown scenarios {unknown}, see the list command")
+        benchmark = run_benchmark(names, args.memory_steps, args.workers)
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(benchmark, f, indent=1)
+        print(f"results saved to {args.output}")
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    rows = compare(baseline, current, args.tolerance)
+    for name, metric, old, new, change, regression in rows:
+        change = "n/a" if change is None else f"{change:+.1%}"
+        print(f"{'REGRESSION' if regression else 'ok':10} {name:28} {metric:18} {old} -> {new} ({change})")
+    regressions = sum(row[-1] for row in rows)
+    print(f"{regressions} regression(s) over {len(rows)} comparisons")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,96 @@
+"""
+  ____  __  __    _              _____    _        __  ____     __
+ / ___||  \/  |  / \            | ____|  / \      |  \/  \ \   / /
+ \___ \| |\/| | / _ \    _____  |  _|   / _ \     | |\/| |\ \ / / 
+  ___) | |  | |/ ___ \  |_____| | |___ / ___ \ _  | |  | | \ V /  
+ |____/|_|  |_/_/   \_\         |_____/_/   \_( ) |_|  |_|  \_/   
+                                              |/                  
+Authors:
+   Maxime Vanderbeken
+   Etienne Andrier
+
+Date : 2025-03-19
+
+License:
+   This file is open source and may be freely used and modified,
+   provided that proper credit is given to the original authors.
+"""
+from .exploration import ExplorationKernel
+
+
+class Team():
+    '''
+    Robots sharing one KnowledgeMap.
+
+    The map does not follow any robot: anchor is the grid position of the map cell at (origin_x, origin_y), which
+    does not move when the map expands, so each member recomputes its own agent_x/agent_y from its grid position
+    with locate().
+    RefinedAgents of the team share one ExplorationKernel per color, their FrontierPlanner stays private.
+    '''
+    def __init__(self, robot):
+        self.members = [robot]
+        self.knowledge_map = robot.knowledge['internal_map']
+        x_origin, y_origin = robot.map_origin()
+        self.anchor = (x_origin + self.knowledge_map.origin_x, y_origin + self.knowledge_map.origin_y)
+        self.explorers = {}
+        if hasattr(robot, 'explorer'):
+            self.explorers[robot.color] = robot.explorer
+
+    def map_origin(self):
+        '''grid position of the cell (0,0) of the shared map'''
+        return (self.anchor[0] - self.knowledge_map.origin_x, self.anchor[1] - self.knowledge_map.origin_y)
+
+    def locate(self, pos):
+        '''map coordinates of the grid position pos'''
+        x_origin, y_origin = self.map_origin()
+        return (pos[0] - x_origin, pos[1] - y_origin)
+
+    def update_explorers(self, x_min, x_max, y_min, y_max):
+        for explorer in self.explorers.values():
+            explorer.update(self.knowledge_map, x_min, x_max, y_min, y_max)
+
+    def absorb(self, other):
+        '''Merge the map of other into ours (freshest information wins) and take over its members'''
+        x_origin, y_origin = self.map_origin()
+        x_other, y_other = other.map_origin()
+        _, box = self.knowledge_map.merge(other.knowledge_map.view, x_other - x_origin, y_other - y_origin)
+        if box is not None:
+            self.update_explorers(*box)
+        for robot in other.members:
+            robot.team = self
+            robot.knowledge['internal_map'] = self.knowledge_map
+            if hasattr(robot, 'explorer'):
+                if robot.color not in self.explorers:
+                    self.explorers[robot.color] = ExplorationKernel(robot.color)
+                robot.explorer = self.explorers[robot.color]
+                # its path was planned on the old map
+                robot.planner.clear()
+        self.members.extend(other.members)
+
+
+class Blackboard():
+    '''
+    Team knowledge store of the communicating robots.
+
+    Every robot starts in its own team, robots of a communication cluster are put in the same team.
+    Teams are joined like in a union-find with union by size: the smaller team is absorbed by the larger one, so
+    that every robot changes team O(log n) times and finding a robot's team is just robot.team.
+    Once two robots are teammates meeting again costs nothing, and the team keeps a single copy of its map.
+    '''
+    def __init__(self, robots):
+        for robot in robots:
+            robot.team = Team(robot)
+
+    def join(self, robots):
+        '''Put the robots of a communication cluster in the same team, returns the number of teams absorbed'''
+        teams = self.teams(robots)
+        if len(teams) < 2:
+            return 0
+        teams.sort(key=lambda team: len(team.members), reverse=True)
+        for team in teams[1:]:
+            teams[0].absorb(team)
+        return len(teams) - 1
+
+    def teams(self, robots):
+        '''distinct teams of robots'''
+        return list({id(robot.team): robot.team for robot in robots}.values())
@@ -0,0 +1,58 @@
+"""
+  ____  __  __    _              _____    _        __  ____     __
+ / ___||  \/  |  / \            | ____|  / \      |  \/  \ \   / /
+ \___ \| |\/| | / _ \    _____  |  _|   / _ \     | |\/| |\ \ / / 
+  ___) | |  | |/ ___ \  |_____| | |___ / ___ \ _  | |  | | \ V /  
+ |____/|_|  |_/_/   \_\         |_____/_/   \_( ) |_|  |_|  \_/   
+                                              |/                  
+Authors:
+   Maxime Vanderbeken
+   Etienne Andrier
+
+Date : 2025-03-19
+
+License:
+   This file is open source and may be freely used and modified,
+   provided that proper credit is given to the original authors.
+"""
+import glob
+import hashlib
+import json
+import os
+
+
+def _code_version():
+    '''hash of the sources of this package, results produced by another version of the code are never reused'''
+    digest = hashlib.sha256()
+    for path in sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), "*.py"))):
+        digest.update(os.path.basename(path).encode())
+        with open(path, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+
+CODE_VERSION = _code_version()
+# where a run stopped by its time budget ends depends on the load of the machine, not on its config, it is never reused
+UNCACHED_TERMINATIONS = ("wall_budget", "cpu_budget")
+
+
+def run_key(config):
+    '''
+    Content address of a run: hash of its config (seed and strategy included, save_path excluded) and of
+    CODE_VERSION. Two runs with the same key produce the same results.
+    '''
+    content = {name: value for name, value in config.items() if name != "save_path"}
+    content["code_version"] = CODE_VERSION
+    return hashlib.sha256(json.dumps(content, sort_keys=True).encode()).hexdigest()[:20]
+
+
+def load_summary(run_dir):
+    '''summary.json of a completed run directory, None if there is no completed run there or if it is not reusable'''
+    try:
+        with open(os.path.join(run_dir, "summary.json")) as f:
+            summary = json.load(f)
+    except FileNotFoundError:
+        return None
+    if summary.get("termination") in UNCACHED_TERMINATIONS:
+        return None
+    return summary
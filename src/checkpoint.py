@@ -0,0 +1,72 @@
+"""
+  ____  __  __    _              _____    _        __  ____     __
+ / ___||  \/  |  / \            | ____|  / \      |  \/  \ \   / /
+ \___ \| |\/| | / _ \    _____  |  _|   / _ \     | |\/| |\ \ / / 
+  ___) | |  | |/ ___ \  |_____| | |___ / ___ \ _  | |  | | \ V /  
+ |____/|_|  |_/_/   \_\         |_____/_/   \_( ) |_|  |_|  \_/   
+                                              |/                  
+Authors:
+   Maxime Vanderbeken
+   Etienne Andrier
+
+Date : 2025-03-19
+
+License:
+   This file is open source and may be freely used and modified,
+   provided that proper credit is given to the original authors.
+"""
+import os
+import pickle
+import struct
+
+# file layout: MAGIC, header (pickle size, number of buffers), the size of each buffer, the pickle stream, then the
+# buffers one after the other. Arrays (grid layers, knowledge maps, RNG-free numpy state...) are pickled out of band
+# (protocol 5), so they are stored as their raw bytes and read back without any conversion.
+MAGIC = b"WRMCKPT1"
+HEADER = struct.Struct("<QQ")
+SIZE = struct.Struct("<Q")
+
+
+def save_checkpoint(model, path):
+    '''
+    Write the full state of model to path: grid, agents and their knowledge, RNG streams, counters, data collected
+    so far (or the position of the ChunkWriter when streaming), trace and profiler.
+    The file is written next to path then renamed, an interrupted save never leaves a truncated checkpoint.
+    '''
+    buffers = []
+    stream = pickle.dumps(model, protocol=5, buffer_callback=buffers.append)
+    raws = [buffer.raw() for buffer in buffers]
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(HEADER.pack(len(stream), len(raws)))
+        for raw in raws:
+            f.write(SIZE.pack(raw.nbytes))
+        f.write(stream)
+        for raw in raws:
+            f.write(raw)
+    os.replace(tmp_path, path)
+
+
+def load_checkpoint(path):
+    '''
+    Model saved by save_checkpoint, stepping it continues the run exactly as the saved model would have.
+    The SIGINT/SIGTERM handlers of a model created with checkpoint_on_signal are installed again.
+    '''
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a WasteRetrievalModel checkpoint")
+        stream_size, num_buffers = HEADER.unpack(f.read(HEADER.size))
+        sizes = [SIZE.unpack(f.read(SIZE.size))[0] for _ in range(num_buffers)]
+        stream = f.read(stream_size)
+        buffers = []
+        for size in sizes:
+            # writable, so that the arrays rebuilt on them are too
+            buffer = bytearray(size)
+            if f.readinto(buffer) != size:
+                raise ValueError(f"{path} is truncated")
+            buffers.append(buffer)
+    model = pickle.loads(stream, buffers=buffers)
+    if model.checkpoint_on_signal:
+        model.install_signal_handlers()
+    return model
@@ -0,0 +1,624 @@
+"""
+  ____  __  __    _              _____    _        __  ____     __
+ / ___||  \/  |  / \            | ____|  / \      |  \/  \ \   / /
+ \___ \| |\/| | / _ \    _____  |  _|   / _ \     | |\/| |\ \ / / 
+  ___) | |  | |/ ___ \  |_____| | |___ / ___ \ _  | |  | | \ V /  
+ |____/|_|  |_/_/   \_\         |_____/_/   \_( ) |_|  |_|  \_/   
+                                              |/                  
+Authors:
+   Maxime Vanderbeken
+   Etienne Andrier
+
+Date : 2025-03-19
+
+License:
+   This file is open source and may be freely used and modified,
+   provided that proper credit is given to the original authors.
+"""
+import numpy as np
+
+from .variables import color_dict, direction_dict
+from .trace import DEBUG, PICKUP, DROP, FUSION, STATE
+
+DIRECTIONS = list(direction_dict)
+DIRECTION_OFFSETS = np.array([direction_dict[d] for d in DIRECTIONS])
+DIRECTION_INDEX = {tuple(direction_dict[d]): k for k, d in enumerate(DIRECTIONS)}
+NORTH, SOUTH, WEST, EAST = (DIRECTIONS.index(d) for d in ("NORTH", "SOUTH", "WEST", "EAST"))
+# 3x3 observation around a robot, center included
+OBSERVATION_OFFSETS = np.array([(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)])
+
+COLORS = list(color_dict)
+RED = color_dict["red"]
+FINDING_WASTE, TRANSPORTING = 0, 1
+STATES = {"FINDING_WASTE": FINDING_WASTE, "TRANSPORTING": TRANSPORTING}
+inv_states = {STATES[x]:x for x in STATES}
+# where a waste is: on a cell, carried by a robot, disposed, or removed by a fusion
+LYING, CARRIED, ARRIVED, FUSED = 0, 1, 2, 3
+NO_TARGET = -1
+# the refined robots' knowledge takes 6 bytes per robot and grid cell, ArrayEngine refuses to allocate more than this
+MAX_KNOWLEDGE_BYTES = 1 << 30
+# number of (robot, cell) pairs processed at once when choosing targets and paths, bounds the temporary arrays
+TARGET_BATCH_CELLS = 1 << 22
+
+
+def dilate(masks):
+    '''3x3 binary dilation of each (width, height) mask of a (robots, width, height) stack, done as two separable passes'''
+    rows = masks.copy()
+    rows[:, 1:] |= masks[:, :-1]
+    rows[:, :-1] |= masks[:, 1:]
+    dilated = rows.copy()
+    dilated[:, :, 1:] |= rows[:, :, :-1]
+    dilated[:, :, :-1] |= rows[:, :, 1:]
+    return dilated
+
+
+def group_starts(keys):
+    '''for sorted keys, index of the first element of the run of equal keys each element belongs to'''
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]]) if len(keys) else np.zeros(0, dtype=np.int64)
+    return np.repeat(starts, np.diff(np.r_[starts, len(keys)]))
+
+
+class ArrayEngine():
+    '''
+    Structure-of-arrays stepping of the robots of a WasteRetrievalModel.
+
+    Positions, colors, states and carried wastes of all robots, and positions, colors and states of all wastes,
+    live in NumPy arrays. Each step is a handful of batched passes: handoffs, observation, policy, then drops,
+    moves, pickups and fusions applied as array updates, robots earlier in the step's random order winning the
+    conflicts (two robots reaching the same waste) as they do with the object engine. The Mesa agents, grid, cell
+    layers and model counters are written back once per step, so the DataCollector, stall detectors and renderers
+    keep working.
+
+    The refined robots' knowledge is kept in grid coordinates as (robots, width, height) arrays: the step at which
+    each cell was last seen and the number of wastes of the robot's color seen there, the radioactivity being read
+    from the static field of the model. The refined policy is the one of RefinedAgent: the closest known waste, else
+    the target of its ExplorationKernel computed on the robot's known map (the bounding box of the cells it has
+    seen), reached along a FrontierPlanner path over the known walkable cells, with the same invalidation rules.
+    Targets and paths are computed for batches of robots of one color, on the window of the grid their maps cover.
+
+    Runs are not step for step identical to the object engine: all robots observe and decide before any of them
+    moves and random choices come from decision_rng, so the two engines give the same policy and close results
+    on average over seeds, not the same trajectories.
+
+    Memory is O(robots x width x height) for the refined policy, 6 bytes per cell: a model whose knowledge arrays
+    would exceed MAX_KNOWLEDGE_BYTES is refused, use the object engine, whose maps only cover what each robot saw.
+    '''
+    def __init__(self, model):
+        self.model = model
+        self.robots = list(model.robot_agents)
+        n = len(self.robots)
+        self.refined = model.strategy == "refined"
+        self.pos = np.array([robot.pos for robot in self.robots], dtype=np.int64).reshape(n, 2)
+        self.color = np.array([color_dict[robot.color] for robot in self.robots], dtype=np.int64)
+        self.state = np.array([STATES[robot.state] for robot in self.robots], dtype=np.int64)
+        self.wastes = list(model.waste_agents)
+        m = len(self.wastes)
+        self.waste_ids = np.array([waste.unique_id for waste in self.wastes], dtype=np.int64)
+        self.waste_pos = np.array([waste.pos for waste in self.wastes], dtype=np.int64).reshape(m, 2)
+        self.waste_color = np.array([color_dict[waste.color] for waste in self.wastes], dtype=np.int64)
+        self.waste_state = np.array([ARRIVED if waste.arrived else CARRIED if waste.picked_up else LYING
+                                     for waste in self.wastes], dtype=np.int64)
+        # rows in self.wastes of the (at most two) carried wastes, the first slot is filled first, -1 when empty
+        self.carry = np.full((n, 2), -1, dtype=np.int64)
+        rows = {waste.unique_id: k for k, waste in enumerate(self.wastes)}
+        for i, robot in enumerate(self.robots):
+            for k, waste_id in enumerate(robot.knowledge['transporting'][:2]):
+                self.carry[i, k] = rows[waste_id]
+        self.passable = np.stack([model.passable[color] for color in color_dict])
+        # lower bound of each color's zone, used by the west/east boundary rules
+        self.zone_floor = self.color / 3 + 1e-10
+        if self.refined:
+            width, height = model.width, model.height
+            knowledge_bytes = 6 * n * width * height
+            if knowledge_bytes > MAX_KNOWLEDGE_BYTES:
+                raise ValueError(f"The 'arrays' engine would use {knowledge_bytes / 2**30:.1f} GiB of knowledge arrays for "
+                                 f"{n} refined robots on a {width}x{height} grid (limit MAX_KNOWLEDGE_BYTES), use engine='objects'")
+            radioactivity = model.radioactivity
+            self.zone = np.stack([
+                (radioactivity >= 0/3 + 1e-10) & (radioactivity <= 1/3 - 1e-10),
+                (radioactivity >= 1/3 + 1e-10) & (radioactivity <= 2/3 - 1e-10),
+                radioactivity >= 2/3 + 1e-10,
+            ])
+            self.seen = np.full((n, width, height), -1, dtype=np.int32)
+            self.known_waste = np.zeros((n, width, height), dtype=np.int16)
+            self.known_waste_cells = np.zeros(n, dtype=np.int64)
+            # bounding box of the seen cells (x_min, x_max, y_min, y_max), the extent of a RefinedAgent's map
+            self.bbox = np.zeros((n, 4), dtype=np.int64)
+            self.bbox[:, 0::2] = np.iinfo(np.int64).max
+            # FrontierPlanner state of each robot: cells (grid coordinates) left on its path, its goal and goal kind
+            self.path = [[] for _ in range(n)]
+            self.goal = [None] * n
+            self.goal_is_waste = np.zeros(n, dtype=bool)
+
+    def step(self):
+        n = len(self.robots)
+        order = self.model.schedule_rng.permutation(n)
+        rank = np.empty(n, dtype=np.int64)
+        rank[order] = np.arange(n)
+        start = (self.pos.copy(), self.carry.copy(), self.state.copy(), self.waste_state.copy())
+        self.handoff(rank)
+        self.update_states()
+        if self.refined:
+            self.observe()
+        moves, drops = self.decide()
+        dropped, droppers = self.drop(drops)
+        self.move(moves, rank)
+        self.pickup(rank, dropped)
+        self.pickup_dropped(rank, dropped, droppers)
+        self.fuse()
+        self.write_back(*start)
+
+    def cell_keys(self, pos, color):
+        '''one integer per (cell, color) pair'''
+        return (pos[:, 0] * self.model.height + pos[:, 1]) * len(COLORS) + color
+
+    def pooling(self):
+        '''robots looking for waste and carrying exactly one, the ones that pool their wastes when they meet'''
+        return (self.carry[:, 0] >= 0) & (self.carry[:, 1] < 0) & (self.state == FINDING_WASTE)
+
+    def handoff(self, rank):
+        '''
+        Robots of the same color looking for waste and carrying one each on the same cell pool them: grouped by cell,
+        the robots of a group are paired in the step's order and the first of each pair takes the waste of the second.
+        '''
+        candidates = np.nonzero(self.pooling())[0]
+        if len(candidates) < 2:
+            return
+        keys = self.cell_keys(self.pos[candidates], self.color[candidates])
+        sort = np.lexsort((rank[candidates], keys))
+        candidates, keys = candidates[sort], keys[sort]
+        position = np.arange(len(keys)) - group_starts(keys)
+        takers = np.nonzero((position % 2 == 0)[:-1] & (keys[1:] == keys[:-1]))[0]
+        self.transfer(candidates[takers + 1], candidates[takers])
+
+    def transfer(self, givers, takers):
+        self.carry[takers, 1] = self.carry[givers, 0]
+        self.carry[givers, 0] = -1
+
+    def carried_color(self):
+        '''color of the first carried waste of each robot, -1 if it carries nothing'''
+        return np.where(self.carry[:, 0] >= 0, self.waste_color[self.carry[:, 0]], -1)
+
+    def update_states(self):
+        carried_color = self.carried_color()
+        transporting = (carried_color > self.color) | ((self.color == RED) & (carried_color >= RED))
+        self.state[transporting] = TRANSPORTING
+
+    def drop(self, drops):
+        '''
+        The robots of drops put down their first waste, a red one on the disposal cell is disposed.
+        Returns the wastes left lying on their cell and the robots that dropped them.
+        '''
+        model = self.model
+        droppers = np.nonzero(drops)[0]
+        if len(droppers) == 0:
+            return droppers, droppers
+        dropped = self.carry[droppers, 0]
+        self.carry[droppers, 0] = self.carry[droppers, 1]
+        self.carry[droppers, 1] = -1
+        self.state[droppers] = FINDING_WASTE
+        x, y = self.pos[droppers, 0], self.pos[droppers, 1]
+        arrived = (self.waste_color[dropped] == RED) & (x == model.width - 1) & (y == model.height - 1)
+        self.waste_state[dropped] = np.where(arrived, ARRIVED, LYING)
+        np.add.at(model.cell_layers, (x[~arrived], y[~arrived], 2 + self.waste_color[dropped[~arrived]]), 1)
+        model.disposed_waste_count += int(arrived.sum())
+        model.carried_waste_count -= len(dropped)
+        if model.trace is not None:
+            for robot, waste, disposed in zip(droppers, dropped, arrived):
+                model.trace.emit(model.current_step, DEBUG, DROP, self.robots[robot].unique_id, int(self.waste_ids[waste]), int(disposed))
+        return dropped[~arrived], droppers[~arrived]
+
+    def move(self, moves, rank):
+        '''
+        Move the robots of moves (direction index, -1 to stay) and their wastes. A pooling robot reaching the cell
+        of another one that comes later in the step's order gives it its waste, as that one would find it there on
+        its turn with the object engine.
+        '''
+        model = self.model
+        movers = np.nonzero(moves >= 0)[0]
+        before = self.pos.copy()
+        np.subtract.at(model.cell_layers, (before[movers, 0], before[movers, 1], 1), 1)
+        self.pos[movers] += DIRECTION_OFFSETS[moves[movers]]
+        np.add.at(model.cell_layers, (self.pos[movers, 0], self.pos[movers, 1], 1), 1)
+
+        pooling = self.pooling()
+        waiting = np.nonzero(pooling)[0]
+        arriving = movers[pooling[movers]]
+        if len(waiting) and len(arriving):
+            # after handoff() a (cell, color) holds at most one pooling robot
+            waiting_keys = self.cell_keys(before[waiting], self.color[waiting])
+            sort = np.argsort(waiting_keys)
+            waiting, waiting_keys = waiting[sort], waiting_keys[sort]
+            arriving_keys = self.cell_keys(self.pos[arriving], self.color[arriving])
+            found = np.minimum(np.searchsorted(waiting_keys, arriving_keys), len(waiting) - 1)
+            takers = waiting[found]
+            meet = (waiting_keys[found] == arriving_keys) & (rank[arriving] < rank[takers])
+            givers, takers = arriving[meet], takers[meet]
+            # one giver per taker, the earliest, and a robot that takes a waste has none to give
+            sort = np.lexsort((rank[givers], takers))
+            givers, takers = givers[sort], takers[sort]
+            first = np.r_[True, takers[1:] != takers[:-1]] if len(takers) else np.zeros(0, dtype=bool)
+            givers, takers = givers[first], takers[first]
+            keep = ~np.isin(givers, takers)
+            self.transfer(givers[keep], takers[keep])
+
+    def pickup(self, rank, dropped):
+        '''
+        Every robot picks up the wastes of its color lying on its cell until it carries two, the robots of a cell
+        being served in the step's order. The wastes dropped during the step are left to pickup_dropped.
+        '''
+        capacity = (self.carry < 0).sum(axis=1)
+        robots = np.nonzero(capacity > 0)[0]
+        lying = np.setdiff1d(np.nonzero(self.waste_state == LYING)[0], dropped)
+        if len(robots) == 0 or len(lying) == 0:
+            return
+        waste_keys = self.cell_keys(self.waste_pos[lying], self.waste_color[lying])
+        sort = np.argsort(waste_keys, kind="stable")
+        lying, waste_keys = lying[sort], waste_keys[sort]
+        keys = self.cell_keys(self.pos[robots], self.color[robots])
+        first = np.searchsorted(waste_keys, keys, side="left")
+        available = np.searchsorted(waste_keys, keys, side="right") - first
+        robots, keys, first, available = robots[available > 0], keys[available > 0], first[available > 0], available[available > 0]
+        sort = np.lexsort((rank[robots], keys))
+        robots, keys, first, available = robots[sort], keys[sort], first[sort], available[sort]
+        capacity = capacity[robots]
+        # wastes of the cell already taken by the robots served before
+        served = np.cumsum(capacity) - capacity
+        served -= served[group_starts(keys)]
+        taken = np.clip(available - served, 0, capacity)
+        for k in (0, 1):
+            picking = np.nonzero(taken > k)[0]
+            self.take(robots[picking], 2 - capacity[picking] + k, lying[first[picking] + served[picking] + k])
+
+    def pickup_dropped(self, rank, dropped, droppers):
+        '''the wastes dropped during the step can only be picked up by the robots that come after their dropper'''
+        for waste, dropper in zip(dropped, droppers):
+            takers = np.nonzero((self.pos[:, 0] == self.waste_pos[waste, 0]) & (self.pos[:, 1] == self.waste_pos[waste, 1])
+                                & (self.color == self.waste_color[waste]) & (self.carry[:, 1] < 0) & (rank >= rank[dropper]))[0]
+            if len(takers):
+                robot = takers[np.argmin(rank[takers])]
+                self.take(np.array([robot]), np.array([int(self.carry[robot, 0] >= 0)]), np.array([waste]))
+
+    def take(self, robots, slots, rows):
+        '''robots put the lying wastes rows in their carry slots'''
+        model = self.model
+        self.carry[robots, slots] = rows
+        self.waste_state[rows] = CARRIED
+        np.subtract.at(model.cell_layers, (self.waste_pos[rows, 0], self.waste_pos[rows, 1], 2 + self.waste_color[rows]), 1)
+        model.carried_waste_count += len(rows)
+        if model.trace is not None:
+            for robot, waste in zip(robots, rows):
+                model.trace.emit(model.current_step, DEBUG, PICKUP, self.robots[robot].unique_id, int(self.waste_ids[waste]))
+
+    def fuse(self):
+        '''robots carrying two wastes of the same color, red excepted, fuse them into one of the next color'''
+        model = self.model
+        both = (self.carry >= 0).all(axis=1)
+        colors = np.where(self.carry >= 0, self.waste_color[self.carry], -1)
+        for robot in np.nonzero(both & (colors[:, 0] == colors[:, 1]) & (colors[:, 0] != RED))[0]:
+            kept, removed = self.carry[robot]
+            color = self.waste_color[kept]
+            model.waste_count[COLORS[color]] -= 2
+            model.waste_count[COLORS[color + 1]] += 1
+            model.carried_waste_count -= 1
+            self.waste_color[kept] = color + 1
+            self.wastes[kept].color = COLORS[color + 1]
+            self.waste_state[removed] = FUSED
+            self.carry[robot, 1] = -1
+            model.remove_agent(self.wastes[removed])
+            if model.trace is not None:
+                model.trace.emit(model.current_step, DEBUG, FUSION, self.robots[robot].unique_id,
+                                 int(self.waste_ids[kept]), int(self.waste_ids[removed]))
+
+    def write_back(self, start_pos, start_carry, start_state, start_waste_state):
+        '''copy what changed during the step to the Mesa agents and grid'''
+        model = self.model
+        grid = model.grid
+        for i in np.nonzero((self.pos != start_pos).any(axis=1))[0]:
+            grid.move_agent(self.robots[i], (int(self.pos[i, 0]), int(self.pos[i, 1])))
+        holders, slots = np.nonzero(self.carry >= 0)
+        carried = self.carry[holders, slots]
+        stale = np.nonzero((self.waste_pos[carried] != self.pos[holders]).any(axis=1))[0]
+        self.waste_pos[carried] = self.pos[holders]
+        for waste in carried[stale]:
+            grid.move_agent(self.wastes[waste], (int(self.waste_pos[waste, 0]), int(self.waste_pos[waste, 1])))
+        for i in np.nonzero((self.carry != start_carry).any(axis=1))[0]:
+            self.robots[i].knowledge['transporting'][:] = [int(self.waste_ids[waste]) for waste in self.carry[i] if waste >= 0]
+        for i in np.nonzero(self.state != start_state)[0]:
+            self.robots[i].state = inv_states[self.state[i]]
+            if model.trace is not None:
+                model.trace.emit(model.current_step, DEBUG, STATE, self.robots[i].unique_id, int(self.state[i]))
+        for waste in np.nonzero((self.waste_state != start_waste_state) & (self.waste_state != FUSED))[0]:
+            self.wastes[waste].picked_up = bool(self.waste_state[waste] == CARRIED)
+            self.wastes[waste].arrived = bool(self.waste_state[waste] == ARRIVED)
+
+    def observe(self):
+        '''Write the 3x3 observation of every refined robot in its knowledge arrays'''
+        model = self.model
+        cells = self.pos[:, None, :] + OBSERVATION_OFFSETS[None, :, :]
+        valid = (cells[..., 0] >= 0) & (cells[..., 0] < model.width) & (cells[..., 1] >= 0) & (cells[..., 1] < model.height)
+        robot_index = np.nonzero(valid)[0]
+        cx, cy = cells[valid, 0], cells[valid, 1]
+        self.seen[robot_index, cx, cy] = model.current_step
+        new_waste = model.cell_layers[cx, cy, 2 + self.color[robot_index]].astype(np.int16)
+        old_waste = self.known_waste[robot_index, cx, cy]
+        np.add.at(self.known_waste_cells, robot_index, (new_waste > 0).astype(np.int64) - (old_waste > 0))
+        self.known_waste[robot_index, cx, cy] = new_waste
+        # observed block of each robot, clipped to the grid
+        x_min = np.maximum(self.pos[:, 0] - 1, 0)
+        x_max = np.minimum(self.pos[:, 0] + 2, model.width)
+        y_min = np.maximum(self.pos[:, 1] - 1, 0)
+        y_max = np.minimum(self.pos[:, 1] + 2, model.height)
+        np.minimum(self.bbox[:, 0], x_min, out=self.bbox[:, 0])
+        np.maximum(self.bbox[:, 1], x_max, out=self.bbox[:, 1])
+        np.minimum(self.bbox[:, 2], y_min, out=self.bbox[:, 2])
+        np.maximum(self.bbox[:, 3], y_max, out=self.bbox[:, 3])
+        for i, path in enumerate(self.path):
+            if path:
+                self.observe_path(i, x_min[i], x_max[i], y_min[i], y_max[i])
+
+    def observe_path(self, i, x_min, x_max, y_min, y_max):
+        '''FrontierPlanner.observe: drop the path of robot i if the block it just observed affects it'''
+        next_x, next_y = self.path[i][0]
+        goal_x, goal_y = self.goal[i]
+        goal_observed = x_min <= goal_x < x_max and y_min <= goal_y < y_max
+        if x_min <= next_x < x_max and y_min <= next_y < y_max and not self.passable[self.color[i], next_x, next_y]:
+            self.clear_path(i)
+        elif self.goal_is_waste[i] and goal_observed and self.known_waste[i, goal_x, goal_y] == 0:
+            self.clear_path(i)
+        elif not self.goal_is_waste[i] and goal_observed and len(self.path[i]) > 1:
+            self.clear_path(i)
+        elif not self.goal_is_waste[i] and self.known_waste[i, x_min:x_max, y_min:y_max].any():
+            self.clear_path(i)
+
+    def clear_path(self, i):
+        self.path[i] = []
+        self.goal[i] = None
+        self.goal_is_waste[i] = False
+
+    def possible_moves(self):
+        '''(robots, 8) mask of the in-bounds neighbouring cells each robot is allowed to walk on'''
+        neighbours = self.pos[:, None, :] + DIRECTION_OFFSETS[None, :, :]
+        nx, ny = neighbours[..., 0], neighbours[..., 1]
+        in_bounds = (nx >= 0) & (nx < self.model.width) & (ny >= 0) & (ny < self.model.height)
+        nx, ny = np.clip(nx, 0, self.model.width - 1), np.clip(ny, 0, self.model.height - 1)
+        return in_bounds & self.passable[self.color[:, None], nx, ny]
+
+    def random_choice(self, mask):
+        '''Index of a uniformly drawn True column of each row of mask, -1 for empty rows'''
+        draws = np.where(mask, self.model.decision_rng.random(mask.shape), -1)
+        choice = np.argmax(draws, axis=1)
+        return np.where(mask.any(axis=1), choice, -1)
+
+    def decide(self):
+        '''Batched policy evaluation, returns the move (direction index, -1 to stay) and drop flag of each robot'''
+        n = len(self.robots)
+        possible = self.possible_moves()
+        moves = np.full(n, -1, dtype=np.int64)
+        drops = np.zeros(n, dtype=bool)
+        radioactivity = self.model.radioactivity[self.pos[:, 0], self.pos[:, 1]]
+
+        finding = self.state == FINDING_WASTE
+        if self.refined:
+            self.decide_refined(finding, possible, radioactivity, moves)
+        else:
+            green = finding & (self.color == 0)
+            moves[green] = self.random_choice(possible[green])
+            # yellow and red robots go west until the boundary of their zone, then walk north and south
+            others = finding & (self.color != 0)
+            go_west = others & (radioactivity > self.zone_floor) & possible.any(axis=1)
+            moves[go_west] = WEST
+            walk = others & ~go_west
+            north_south = np.zeros_like(possible)
+            north_south[:, [NORTH, SOUTH]] = possible[:, [NORTH, SOUTH]]
+            moves[walk] = self.random_choice(north_south[walk])
+
+        transporting = ~finding
+        east = transporting & possible[:, EAST]
+        moves[east] = EAST
+        north = transporting & ~east & (self.color == RED) & possible[:, NORTH]
+        moves[north] = NORTH
+        drops[transporting & ~east & ~north] = True
+        return moves, drops
+
+    def decide_refined(self, finding, possible, radioactivity, moves):
+        for i in np.nonzero(~finding)[0]:
+            if self.path[i]:
+                self.clear_path(i)
+        finding_index = np.nonzero(finding)[0]
+        next_moves = np.array([self.next_step(i) for i in finding_index], dtype=np.int64).reshape(-1)
+        # robots without a path: the closest known waste if a path reaches it, else the exploration target
+        replan = finding_index[next_moves < 0]
+        with_waste = replan[self.known_waste_cells[replan] > 0]
+        planned = self.plan(with_waste, self.waste_targets(with_waste), goal_is_waste=True)
+        explorers = np.setdiff1d(replan, with_waste[planned])
+        targets = self.exploration_targets(explorers)
+        exploring = targets[:, 0] != NO_TARGET
+        self.plan(explorers[exploring], targets[exploring], goal_is_waste=False)
+        for k in np.nonzero(next_moves < 0)[0]:
+            next_moves[k] = self.next_step(finding_index[k])
+        moves[finding_index] = next_moves
+
+        wander = finding & (moves < 0)
+        if wander.any():
+            # on the west boundary of its zone a robot does not go further west
+            allowed = possible[wander].copy()
+            on_boundary = radioactivity[wander] < self.zone_floor[wander]
+            allowed[on_boundary] &= DIRECTION_OFFSETS[None, :, 0] >= 0
+            moves[wander] = self.random_choice(allowed)
+
+    def next_step(self, i):
+        '''FrontierPlanner.next_step: direction index of the next move of robot i along its path, -1 if it has none'''
+        path = self.path[i]
+        if not path:
+            return -1
+        dx, dy = path[0][0] - self.pos[i, 0], path[0][1] - self.pos[i, 1]
+        if max(abs(dx), abs(dy)) != 1:
+            # the robot is not where the path expects it
+            self.clear_path(i)
+            return -1
+        path.pop(0)
+        return DIRECTION_INDEX[(dx, dy)]
+
+    def batches(self, index):
+        '''
+        Positions in index of batches of robots of the same color, few enough for their (robot, cell) arrays to
+        stay under TARGET_BATCH_CELLS
+        '''
+        size = max(1, TARGET_BATCH_CELLS // (self.model.width * self.model.height))
+        parts = []
+        for color in range(len(COLORS)):
+            members = np.nonzero(self.color[index] == color)[0]
+            parts += [members[k:k + size] for k in range(0, len(members), size)]
+        return parts
+
+    def window(self, index):
+        '''(x_min, x_max, y_min, y_max) of the union of the known maps of the robots of index'''
+        bbox = self.bbox[index]
+        return bbox[:, 0].min(), bbox[:, 1].max(), bbox[:, 2].min(), bbox[:, 3].max()
+
+    def plan(self, index, goals, goal_is_waste):
+        '''
+        FrontierPlanner.plan for the robots of index: breadth first search (8-connected) to their goal over their
+        known walkable cells, the goal itself may still be unknown. Returns which robots got a path.
+        '''
+        planned = np.zeros(len(index), dtype=bool)
+        for i in index:
+            self.clear_path(i)
+        steps = np.abs(goals - self.pos[index]).max(axis=1) if len(index) else np.zeros(0, dtype=np.int64)
+        # a goal next to the robot is its whole path
+        for k in np.nonzero(steps == 1)[0]:
+            self.set_path(index[k], [tuple(map(int, goals[k]))], goal_is_waste)
+        planned[steps == 1] = True
+        far = np.nonzero(steps > 1)[0]
+        for part in self.batches(index[far]):
+            batch = far[part]
+            planned[batch] = self.search(index[batch], goals[batch], goal_is_waste)
+        return planned
+
+    def search(self, index, goals, goal_is_waste):
+        '''
+        batched breadth first search of plan() on the window of the known maps of index, all of one color. The
+        distances to the goals grow by dilation, then each robot walks down them taking the first direction (in
+        direction_dict order) that gets closer: FrontierPlanner's queue finds that same shortest path, the first
+        one in direction order.
+        '''
+        x0, x1, y0, y1 = self.window(index)
+        k = np.arange(len(index))
+        walkable = (self.seen[index, x0:x1, y0:y1] >= 0) & self.passable[self.color[index[0]], x0:x1, y0:y1][None]
+        goal_x, goal_y = goals[:, 0] - x0, goals[:, 1] - y0
+        start_x, start_y = self.pos[index, 0] - x0, self.pos[index, 1] - y0
+        walkable[k, goal_x, goal_y] = True
+        walkable[k, start_x, start_y] = True
+        width, height = walkable.shape[1:]
+        distance = np.full(walkable.shape, -1, dtype=np.int32)
+        distance[k, goal_x, goal_y] = 0
+        # layers are grown for the robots whose start is not reached yet, their rows are copied back once done
+        active, grown = k, distance.copy()
+        frontier = grown == 0
+        layer = 0
+        while len(active):
+            layer += 1
+            frontier = dilate(frontier) & walkable & (grown < 0)
+            grown[frontier] = layer
+            done = frontier[np.arange(len(active)), start_x[active], start_y[active]] | ~frontier.any(axis=(1, 2))
+            if done.any():
+                distance[active[done]] = grown[done]
+                keep = ~done
+                active, walkable, grown, frontier = active[keep], walkable[keep], grown[keep], frontier[keep]
+
+        robots = np.nonzero(distance[k, start_x, start_y] > 0)[0]
+        paths = {int(j): [] for j in robots}
+        x, y = start_x[robots], start_y[robots]
+        while len(robots):
+            current = distance[robots, x, y]
+            step = np.full(len(robots), -1)
+            for direction in reversed(range(len(DIRECTIONS))):
+                nx, ny = x + DIRECTION_OFFSETS[direction, 0], y + DIRECTION_OFFSETS[direction, 1]
+                inside = np.nonzero((nx >= 0) & (nx < width) & (ny >= 0) & (ny < height))[0]
+                closer = inside[distance[robots[inside], nx[inside], ny[inside]] == current[inside] - 1]
+                step[closer] = direction
+            x, y = x + DIRECTION_OFFSETS[step, 0], y + DIRECTION_OFFSETS[step, 1]
+            for j, cx, cy in zip(robots.tolist(), (x + x0).tolist(), (y + y0).tolist()):
+                paths[j].append((cx, cy))
+            keep = current > 1
+            robots, x, y = robots[keep], x[keep], y[keep]
+        for j, path in paths.items():
+            self.set_path(int(index[j]), path, goal_is_waste)
+        planned = np.zeros(len(index), dtype=bool)
+        planned[list(paths)] = True
+        return planned
+
+    def set_path(self, i, path, goal_is_waste):
+        self.path[i] = path
+        self.goal[i] = path[-1]
+        self.goal_is_waste[i] = goal_is_waste
+
+    def closest(self, candidates, index, exclude_self, origin=(0, 0)):
+        '''
+        For each robot of index, closest True cell of its candidates layer (a window of the grid starting at origin),
+        the first one in row-major order on ties, (-1, -1) if none
+        '''
+        target = np.full((len(index), 2), NO_TARGET, dtype=np.int64)
+        k, cx, cy = np.nonzero(candidates)
+        cx, cy = cx + origin[0], cy + origin[1]
+        dx, dy = cx - self.pos[index[k], 0], cy - self.pos[index[k], 1]
+        distance = dx * dx + dy * dy
+        if exclude_self:
+            keep = distance > 0
+            k, cx, cy, distance = k[keep], cx[keep], cy[keep], distance[keep]
+        if len(k) == 0:
+            return target
+        # stable sort: among the cells of a robot at the same distance, the row-major order of nonzero is kept
+        sort = np.lexsort((distance, k))
+        first = sort[np.r_[True, k[sort][1:] != k[sort][:-1]]]
+        target[k[first], 0] = cx[first]
+        target[k[first], 1] = cy[first]
+        return target
+
+    def waste_targets(self, index):
+        '''closest known waste of each robot of index'''
+        targets = np.full((len(index), 2), NO_TARGET, dtype=np.int64)
+        for part in self.batches(index):
+            batch = index[part]
+            x0, x1, y0, y1 = self.window(batch)
+            targets[part] = self.closest(self.known_waste[batch, x0:x1, y0:y1] > 0, batch, exclude_self=False, origin=(x0, y0))
+        return targets
+
+    def exploration_targets(self, index):
+        '''
+        ExplorationKernel.target of the robots of index on their known map: the closest unknown cell next to their
+        zone, else the cell maximizing age - manhattan distance, (-1, -1) if nothing is worth exploring
+        '''
+        targets = np.full((len(index), 2), NO_TARGET, dtype=np.int64)
+        for part in self.batches(index):
+            targets[part] = self._exploration_targets(index[part])
+        return targets
+
+    def _exploration_targets(self, index):
+        x0, x1, y0, y1 = self.window(index)
+        xs = np.arange(x0, x1, dtype=np.int32)[None, :, None]
+        ys = np.arange(y0, y1, dtype=np.int32)[None, None, :]
+        bbox = self.bbox[index][:, :, None, None]
+        in_map = (xs >= bbox[:, 0]) & (xs < bbox[:, 1]) & (ys >= bbox[:, 2]) & (ys < bbox[:, 3])
+        seen = self.seen[index, x0:x1, y0:y1]
+        known = seen >= 0
+        dilated = dilate(self.zone[self.color[index[0]], x0:x1, y0:y1][None] & known) & in_map
+        frontier = dilated & ~known
+        has_frontier = frontier.any(axis=(1, 2))
+        targets = np.full((len(index), 2), NO_TARGET, dtype=np.int64)
+        targets[has_frontier] = self.closest(frontier[has_frontier], index[has_frontier], exclude_self=True, origin=(x0, y0))
+
+        rest = ~has_frontier
+        if not rest.any():
+            return targets
+        aging = index[rest]
+        age = np.where(known[rest], np.int32(self.model.current_step) - seen[rest], -1)
+        px = self.pos[aging, 0].astype(np.int32)[:, None, None]
+        py = self.pos[aging, 1].astype(np.int32)[:, None, None]
+        value = age - (np.abs(xs - px) + np.abs(ys - py))
+        best = np.where(dilated[rest], value, -10000).max(axis=(1, 2))
+        target = self.closest((value == best[:, None, None]) & in_map[rest], aging, exclude_self=True, origin=(x0, y0))
+        target[best <= 0] = NO_TARGET
+        targets[rest] = target
+        return targets
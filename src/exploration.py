@@ -0,0 +1,208 @@
+"""
+  ____  __  __    _              _____    _        __  ____     __
+ / ___||  \/  |  / \            | ____|  / \      |  \/  \ \   / /
+ \___ \| |\/| | / _ \    _____  |  _|   / _ \     | |\/| |\ \ / / 
+  ___) | |  | |/ ___ \  |_____| | |___ / ___ \ _  | |  | | \ V /  
+ |____/|_|  |_/_/   \_\         |_____/_/   \_( ) |_|  |_|  \_/   
+                                              |/                  
+Authors:
+   Maxime Vanderbeken
+   Etienne Andrier
+
+Date : 2025-03-19
+
+License:
+   This file is open source and may be freely used and modified,
+   provided that proper credit is given to the original authors.
+"""
+from collections import deque
+
+import numpy as np
+from scipy.ndimage import binary_dilation
+
+from .variables import color_dict,direction_dict
+
+DILATION_STRUCTURE = np.ones((3, 3))
+
+
+def closest_cell(mask, x, y, exclude_self=False):
+    '''
+    Offset (dx, dy) from (x, y) to the True cell of mask with the smallest squared euclidean distance,
+    the first one in row-major order on ties. Returns None if there is no candidate.
+    '''
+    xs, ys = np.nonzero(mask)
+    dx = xs - x
+    dy = ys - y
+    if exclude_self:
+        keep = (dx != 0) | (dy != 0)
+        dx = dx[keep]
+        dy = dy[keep]
+    if dx.size == 0:
+        return None
+    closest = np.argmin(dx*dx + dy*dy)
+    return (int(dx[closest]), int(dy[closest]))
+
+
+class ExplorationKernel():
+    '''
+    Target selection for an exploring RefinedAgent of a given color.
+
+    Keeps the robot's zone mask (cells whose radioactivity belongs to the robot's zone) and its 3x3 dilation
+    aligned with the buffer of the robot's KnowledgeMap. After each observation only the rewritten cells and
+    their neighbours are recomputed, a full recomputation only happens when the map gets a new buffer
+    (buffer growth or merge).
+    '''
+    def __init__(self, color):
+        self.color = color
+        self.buffer = None
+
+    def zone(self, radioactivity):
+        if self.color == "red":
+            return radioactivity >= (color_dict[self.color]/3 + 1e-10)
+        return (radioactivity >= (color_dict[self.color]/3 + 1e-10)) & (radioactivity <= ((color_dict[self.color] +1)/3 - 1e-10))
+
+    def _refresh(self, knowledge_map):
+        self.buffer = knowledge_map.buffer
+        self.zone_mask = self.zone(self.buffer[:,:,0])
+        self.dilated = binary_dilation(self.zone_mask, structure=DILATION_STRUCTURE)
+
+    def update(self, knowledge_map, x_min, x_max, y_min, y_max):
+        '''Cells [x_min,x_max[ x [y_min,y_max[ (map coordinates) of knowledge_map have been rewritten'''
+        if knowledge_map.buffer is not self.buffer:
+            self._refresh(knowledge_map)
+            return
+        len_x, len_y = self.zone_mask.shape
+        x0, x1 = max(x_min + knowledge_map.x0, 0), min(x_max + knowledge_map.x0, len_x)
+        y0, y1 = max(y_min + knowledge_map.y0, 0), min(y_max + knowledge_map.y0, len_y)
+        self.zone_mask[x0:x1, y0:y1] = self.zone(self.buffer[x0:x1, y0:y1, 0])
+        # the dilation can only change within one cell of the rewritten block, and depends on one more cell around it
+        dx0, dx1, dy0, dy1 = max(x0 - 1, 0), min(x1 + 1, len_x), max(y0 - 1, 0), min(y1 + 1, len_y)
+        sx0, sx1, sy0, sy1 = max(dx0 - 1, 0), min(dx1 + 1, len_x), max(dy0 - 1, 0), min(dy1 + 1, len_y)
+        local = binary_dilation(self.zone_mask[sx0:sx1, sy0:sy1], structure=DILATION_STRUCTURE)
+        self.dilated[dx0:dx1, dy0:dy1] = local[dx0 - sx0:dx1 - sx0, dy0 - sy0:dy1 - sy0]
+
+    def dilated_zone(self, knowledge_map):
+        '''Dilated zone mask as a (n, p) view matching knowledge_map'''
+        if knowledge_map.buffer is not self.buffer:
+            self._refresh(knowledge_map)
+        return self.dilated[knowledge_map.x0:knowledge_map.x0 + knowledge_map.n, knowledge_map.y0:knowledge_map.y0 + knowledge_map.p]
+
+    def target(self, knowledge_map, x, y, step):
+        '''
+        Offset towards the exploration target of a robot at (x, y), or None if nothing is worth exploring:
+        the closest unknown cell next to the zone if there is one, otherwise the cell maximizing age - manhattan distance,
+        the age of a cell being step minus the step at which it was last seen.
+        '''
+        dilated = self.dilated_zone(knowledge_map)
+        seen_map = knowledge_map[:,:,-1]
+        unknown = dilated & (seen_map == -1)
+        if unknown.any():
+            return closest_cell(unknown, x, y, exclude_self=True)
+        age_map = np.where(seen_map == -1, -1, step - seen_map)
+        len_x, len_y = age_map.shape
+        distance_map = np.abs(np.arange(len_x) - x)[:,None] + np.abs(np.arange(len_y) - y)[None,:]
+        value = age_map - distance_map
+        target = np.max(np.where(dilated, value, -10000))
+        if target <= 0:
+            return None
+        return closest_cell(value == target, x, y, exclude_self=True)
+
+
+class FrontierPlanner():
+    '''
+    Path cache of a RefinedAgent.
+
+    plan() runs a breadth first search (8-connected) from the robot to a goal over the known cells of the
+    KnowledgeMap the robot is allowed to walk on, the goal itself may still be unknown (frontier).
+    The path is stored relative to the map origin so that expansions of the map do not invalidate it, and
+    observe() only drops it when the observed cells affect it: next cell not walkable, goal explored,
+    targeted waste gone, or a waste worth going for seen while exploring.
+    '''
+    def __init__(self, color, max_radioactivity):
+        self.waste_channel = 2 + color_dict[color]
+        self.max_radioactivity = max_radioactivity
+        self.clear()
+
+    def clear(self):
+        self.path = []
+        self.goal = None
+        self.goal_is_waste = False
+        self.knowledge_map = None
+
+    def _to_origin(self, knowledge_map, x, y):
+        return (x - knowledge_map.origin_x, y - knowledge_map.origin_y)
+
+    def _to_map(self, knowledge_map, cell):
+        return (cell[0] + knowledge_map.origin_x, cell[1] + knowledge_map.origin_y)
+
+    def walkable(self, knowledge_map, x, y):
+        return knowledge_map[x,y,-1] != -1 and knowledge_map[x,y,0] <= self.max_radioactivity
+
+    def observe(self, knowledge_map, x_min, x_max, y_min, y_max):
+        '''Cells [x_min,x_max[ x [y_min,y_max[ (map coordinates) of knowledge_map have been rewritten'''
+        if not self.path:
+            return
+        if knowledge_map is not self.knowledge_map:
+            self.clear()
+            return
+        len_x, len_y = knowledge_map.shape[:2]
+        x_min, x_max, y_min, y_max = max(x_min, 0), min(x_max, len_x), max(y_min, 0), min(y_max, len_y)
+        next_x, next_y = self._to_map(knowledge_map, self.path[0])
+        goal_x, goal_y = self._to_map(knowledge_map, self.goal)
+        goal_observed = x_min <= goal_x < x_max and y_min <= goal_y < y_max
+        if x_min <= next_x < x_max and y_min <= next_y < y_max and not self.walkable(knowledge_map, next_x, next_y):
+            self.clear()
+        elif self.goal_is_waste and goal_observed and knowledge_map[goal_x,goal_y,self.waste_channel] == 0:
+            self.clear()
+        elif not self.goal_is_waste and goal_observed and knowledge_map[goal_x,goal_y,-1] != -1 and len(self.path) > 1:
+            self.clear()
+        elif not self.goal_is_waste and knowledge_map[x_min:x_max,y_min:y_max,self.waste_channel].any():
+            self.clear()
+
+    def plan(self, knowledge_map, x, y, target, goal_is_waste):
+        '''Plan a path from (x, y) to the cell at offset target, returns False if it cannot be reached'''
+        self.clear()
+        len_x, len_y = knowledge_map.shape[:2]
+        goal = (x + target[0], y + target[1])
+        walkable = (knowledge_map[:,:,-1] != -1) & (knowledge_map[:,:,0] <= self.max_radioactivity)
+        walkable[goal] = True
+        start = x * len_y + y
+        goal_index = goal[0] * len_y + goal[1]
+        previous = {start: None}
+        queue = deque([start])
+        while queue and goal_index not in previous:
+            current = queue.popleft()
+            cx, cy = divmod(current, len_y)
+            for dx, dy in direction_dict.values():
+                nx, ny = cx + dx, cy + dy
+                if 0 <= nx < len_x and 0 <= ny < len_y and walkable[nx, ny]:
+                    neighbour = nx * len_y + ny
+                    if neighbour not in previous:
+                        previous[neighbour] = current
+                        queue.append(neighbour)
+        if goal_index not in previous or goal_index == start:
+            return False
+        path = []
+        current = goal_index
+        while current != start:
+            path.append(self._to_origin(knowledge_map, *divmod(current, len_y)))
+            current = previous[current]
+        path.reverse()
+        self.path = path
+        self.goal = path[-1]
+        self.goal_is_waste = goal_is_waste
+        self.knowledge_map = knowledge_map
+        return True
+
+    def next_step(self, knowledge_map, x, y):
+        '''Offset of the next move along the cached path from (x, y), or None if there is no valid path'''
+        if not self.path or knowledge_map is not self.knowledge_map:
+            return None
+        next_x, next_y = self._to_map(knowledge_map, self.path[0])
+        dx, dy = next_x - x, next_y - y
+        if max(abs(dx), abs(dy)) != 1:
+            # the robot is not where the path expects it
+            self.clear()
+            return None
+        self.path.pop(0)
+        return (dx, dy)
@@ -0,0 +1,171 @@
+"""
+  ____  __  __    _              _____    _        __  ____     __
+ / ___||  \/  |  / \            | ____|  / \      |  \/  \ \   / /
+ \___ \| |\/| | / _ \    _____  |  _|   / _ \     | |\/| |\ \ / / 
+  ___) | |  | |/ ___ \  |_____| | |___ / ___ \ _  | |  | | \ V /  
+ |____/|_|  |_/_/   \_\         |_____/_/   \_( ) |_|  |_|  \_/   
+                                              |/                  
+Authors:
+   Maxime Vanderbeken
+   Etienne Andrier
+
+Date : 2025-03-19
+
+License:
+   This file is open source and may be freely used and modified,
+   provided that proper credit is given to the original authors.
+"""
+import contextlib
+import multiprocessing
+import os
+import shutil
+import sys
+import time
+import traceback
+import uuid
+from multiprocessing.connection import wait
+
+import pandas as pd
+
+from .cache import load_summary, run_key
+from .sweep import print_progress
+
+# options of a branch, see fork_model
+BRANCH_OPTIONS = ["seed", "strategy", "add_robots", "max_steps", "finish_threshold", "save_path", "setup", "setup_key"]
+
+
+def setup_identifier(branch):
+    '''
+    What identifies the setup function of a branch in its config, and so in its run key: branch["setup_key"] if given,
+    otherwise the qualified name of the function. A function without a unique name (lambda, local function, partial)
+    gets a random identifier, so its branch is never taken for another one and never reused from the cache.
+    '''
+    if "setup_key" in branch:
+        return branch["setup_key"]
+    setup = branch["setup"]
+    name = getattr(setup, "__qualname__", None)
+    if name is None or "<" in name:
+        return f"anonymous-{uuid.uuid4().hex}"
+    return f"{setup.__module__}.{name}"
+
+
+def switch_strategy(model, strategy):
+    '''Switch a model between the 'refined' and 'communication' strategies, which use the same robots'''
+    if model.strategy != 'refined' or strategy not in ('refined', 'communication'):
+        raise ValueError(f"Cannot switch from strategy {model.config['strategy']!r} to {strategy!r}, "
+                         "only 'refined' and 'communication' can be switched")
+    if strategy == 'communication' and model.engine is not None:
+        raise ValueError("The 'arrays' engine does not support the communication strategy")
+    model.communicate = strategy == 'communication'
+    if not model.communicate:
+        model.blackboard = None
+
+
+def prepare_branch(model, index, branch, parent_key):
+    '''
+    Turn the (forked) copy of the parent model into branch index: its own RNG streams (branch["seed"] or derived
+    from the parent seed, the step and index), the changes of the branch, and its own run directory under
+    branch["save_path"] (default: save_path/fork_<parent run key>_<step>/ of the parent).
+    Returns the directory of the completed branch if it already exists, None otherwise.
+    '''
+    unknown = set(branch) - set(BRANCH_OPTIONS)
+    if unknown:
+        raise ValueError(f"Unknown branch options {sorted(unknown)}, expected some of {BRANCH_OPTIONS}")
+    step = model.current_step
+    model.create_rng_streams(branch.get("seed", [model.seed, step, index]))
+    if "strategy" in branch:
+        switch_strategy(model, branch["strategy"])
+    for color, count in branch.get("add_robots", {}).items():
+        for _ in range(count):
+            model.add_robot(color)
+    for name in ("max_steps", "finish_threshold"):
+        if name in branch:
+            setattr(model, name, branch[name])
+    if "setup" in branch:
+        branch["setup"](model)
+
+    parent_dir = model.run_dir
+    model.run_dir = None
+    model.save_path = branch.get("save_path", os.path.join(model.save_path, f"fork_{parent_key}_{step}/"))
+    model.create_config()
+    model.config["forked_from"] = {"run": parent_key, "step": step}
+    if "setup" in branch:
+        model.config["setup"] = setup_identifier(branch)
+    if load_summary(model.completed_run_dir()) is not None:
+        return model.completed_run_dir()
+    if model.writer is not None:
+        # the chunks of the common prefix
+        run_dir = model.get_run_dir()
+        for name in os.listdir(parent_dir):
+            if name.endswith(".npz") or name == "telemetry.json":
+                shutil.copy2(os.path.join(parent_dir, name), run_dir)
+        model.writer.reopen(run_dir)
+    return None
+
+
+def _run_branch(model, index, branch, parent_key, connection, quiet):
+    '''Entry point of a forked branch, sends its result to the parent and never raises'''
+    params = {name: value for name, value in branch.items() if name != "setup"}
+    start = time.perf_counter()
+    try:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull if quiet else sys.stdout):
+            completed = prepare_branch(model, index, branch, parent_key)
+            if completed is not None:
+                result = {**load_summary(completed), "cached": True, "run_dir": completed}
+            else:
+                while not model.finished:
+                    model.step()
+                result = {"steps": model.current_step, "termination": model.termination, **model.stats(), "cached": False, "run_dir": model.get_run_dir()}
+        result = {"index": index, "status": "ok", "error": None, **params, "elapsed": time.perf_counter() - start, **result}
+    except Exception:
+        result = {"index": index, "status": "failed", "error": traceback.format_exc(), **params}
+    connection.send(result)
+    connection.close()
+
+
+def fork_model(model, branches, workers=None, quiet=True, progress=print_progress):
+    '''
+    Continue a live model along several branches, each one in a child process created with os.fork, so that the
+    branches start from a copy-on-write copy of the model and the steps already simulated are not simulated again.
+    For instance, step a model until model.waste_count['green'] == 0, then fork it with different seeds or strategies.
+
+    branches is a list of dicts whose keys are in BRANCH_OPTIONS: "seed" (default: a distinct stream derived from
+    the model seed), "strategy" (switch between 'refined' and 'communication'), "add_robots" ({color: count}),
+    "max_steps", "finish_threshold", "save_path" (see prepare_branch) and "setup", a function called with the
+    branch's model for any other change, identified in the branch config by "setup_key" (see setup_identifier). At most workers (default: number of CPUs) branches run at once.
+    Each branch saves its data in its own run directory, a branch whose result already exists is not run again.
+    The parent model is left untouched.
+    Returns a DataFrame with one row per branch (options, status, steps and final stats), as run_sweep.
+    '''
+    if model.finished:
+        raise ValueError("Cannot fork a finished model")
+    if model.writer is not None:
+        model.writer.drain()
+    workers = workers or os.cpu_count()
+    parent_key = run_key(model.config)
+    context = multiprocessing.get_context("fork")
+    pending = list(enumerate(branches))
+    running = {}
+    results = []
+    while pending or running:
+        while pending and len(running) < workers:
+            index, branch = pending.pop(0)
+            receiver, sender = context.Pipe(duplex=False)
+            process = context.Process(target=_run_branch, args=(model, index, branch, parent_key, sender, quiet))
+            process.start()
+            sender.close()
+            running[receiver] = (index, branch, process)
+        for receiver in wait(list(running)):
+            index, branch, process = running.pop(receiver)
+            try:
+                result = receiver.recv()
+            except EOFError:
+                # the branch process itself died
+                process.join()
+                params = {name: value for name, value in branch.items() if name != "setup"}
+                result = {"index": index, "status": "failed", "error": f"branch process exited with code {process.exitcode}", **params}
+            process.join()
+            results.append(result)
+            if progress is not None:
+                progress(len(results), len(branches), result)
+    return pd.DataFrame(results).sort_values("index").set_index("index")
@@ -63,6 +63,162 @@ def expand_grid(grid, direction):
     return new_grid
 
 
+#side (in cells) of the tiles in which KnowledgeMap allocates its buffer
+TILE_SIZE = 16
+
+class KnowledgeMap():
+    """
+    Robot internal map of shape (n, p, d), stored in a buffer allocated in whole tiles of TILE_SIZE x TILE_SIZE cells.
+
+    The known part of the map is a window of that buffer, so indexing it or taking a channel slice returns a view
+    and the map can be used like the numpy array it replaces (in_map, get_radioactivity, [:,:,k], masks...).
+    expand() grows the window by one row or column like expand_grid, but only copies when the buffer has no tile
+    left on that side, in which case the buffer doubles on that axis: exploration costs O(1) amortized per step.
+    """
+    def __init__(self, shape=(1,1,6), tile_size=TILE_SIZE):
+        n, p, d = shape
+        self.tile_size = tile_size
+        self.buffer = self._allocate(self._round_to_tiles(n + tile_size), self._round_to_tiles(p + tile_size), d)
+        # keep the window centered so that it can grow in every direction
+        self.x0 = (self.buffer.shape[0] - n) // 2
+        self.y0 = (self.buffer.shape[1] - p) // 2
+        self.n = n
+        self.p = p
+        # map coordinates of the first cell of the map, they move when expanding west or south
+        self.origin_x = 0
+        self.origin_y = 0
+        self.view[...] = 0
+
+    @classmethod
+    def from_array(cls, grid, tile_size=TILE_SIZE):
+        """Build a KnowledgeMap holding a copy of a (n, p, d) array"""
+        knowledge_map = cls(grid.shape, tile_size)
+        knowledge_map.view[...] = grid
+        return knowledge_map
+
+    def _round_to_tiles(self, length):
+        return -(-length // self.tile_size) * self.tile_size
+
+    def _allocate(self, len_x, len_y, d):
+        buffer = np.zeros((len_x, len_y, d))
+        #fog of war
+        buffer[:,:,-1] = -1
+        return buffer
+
+    @property
+    def view(self):
+        return self.buffer[self.x0:self.x0 + self.n, self.y0:self.y0 + self.p]
+
+    @property
+    def shape(self):
+        return (self.n, self.p, self.buffer.shape[2])
+
+    @property
+    def dtype(self):
+        return self.buffer.dtype
+
+    def __getitem__(self, key):
+        return self.view[key]
+
+    def __setitem__(self, key, value):
+        self.view[key] = value
+
+    def __array__(self, dtype=None, copy=None):
+        if copy:
+            return np.array(self.view, dtype=dtype)
+        return np.asarray(self.view, dtype=dtype)
+
+    def copy(self):
+        return KnowledgeMap.from_array(self.view, self.tile_size)
+
+    def _grow(self, axis, front):
+        """Double the buffer along axis (0 for x, 1 for y), adding the new tiles in front or at the back"""
+        extra = self.buffer.shape[axis]
+        len_x, len_y, d = self.buffer.shape
+        if axis == 0:
+            new_buffer = self._allocate(len_x + extra, len_y, d)
+        else:
+            new_buffer = self._allocate(len_x, len_y + extra, d)
+        if front:
+            if axis == 0:
+                self.x0 += extra
+            else:
+                self.y0 += extra
+        offset_x = extra if front and axis == 0 else 0
+        offset_y = extra if front and axis == 1 else 0
+        new_buffer[offset_x:offset_x + len_x, offset_y:offset_y + len_y] = self.buffer
+        self.buffer = new_buffer
+
+    def expand(self, direction):
+        """
+        Expands the map by one row or column in the specified direction, same convention as expand_grid.
+
+        Parameters:
+        direction (tuple): One of (0,1), (0,-1), (1,0), (-1,0)
+        """
+        if direction == (1, 0):  # East
+            if self.x0 + self.n == self.buffer.shape[0]:
+                self._grow(0, front=False)
+            self.n += 1
+        elif direction == (-1, 0):  # West
+            if self.x0 == 0:
+                self._grow(0, front=True)
+            self.x0 -= 1
+            self.n += 1
+            self.origin_x += 1
+        elif direction == (0, 1):  # North
+            if self.y0 + self.p == self.buffer.shape[1]:
+                self._grow(1, front=False)
+            self.p += 1
+        elif direction == (0, -1):  # South
+            if self.y0 == 0:
+                self._grow(1, front=True)
+            self.y0 -= 1
+            self.p += 1
+            self.origin_y += 1
+        else:
+            raise ValueError("Direction must be one of (0,1), (0,-1), (1,0), or (-1,0)")
+
+    def include(self, x_min, x_max, y_min, y_max):
+        """
+        Expands the map until it covers the cells [x_min,x_max[ x [y_min,y_max[ (map coordinates).
+
+        Returns:
+        tuple: (shift_x, shift_y) added to the map coordinates of every cell by the westward and southward growth
+        """
+        shift_x = max(0, -x_min)
+        shift_y = max(0, -y_min)
+        for _ in range(shift_x):
+            self.expand((-1, 0))
+        for _ in range(max(0, x_max - self.n + shift_x)):
+            self.expand((1, 0))
+        for _ in range(shift_y):
+            self.expand((0, -1))
+        for _ in range(max(0, y_max - self.p + shift_y)):
+            self.expand((0, 1))
+        return shift_x, shift_y
+
+    def merge(self, cells, x_min, y_min):
+        """
+        Writes the cells of a (len_x, len_y, d) array, whose cell (0,0) goes to map coordinates (x_min, y_min), where
+        they were seen later than in the map (last channel, -1 if never seen). The map is expanded to cover them first.
+
+        Returns:
+        tuple: (shift_x, shift_y) as returned by include, and the (x_min, x_max, y_min, y_max) box of the written cells
+               in the shifted map coordinates, None if nothing was written
+        """
+        len_x, len_y = cells.shape[:2]
+        shift_x, shift_y = self.include(x_min, x_min + len_x, y_min, y_min + len_y)
+        x_min, y_min = x_min + shift_x, y_min + shift_y
+        block = self.view[x_min:x_min + len_x, y_min:y_min + len_y]
+        newer = cells[:, :, -1] > block[:, :, -1]
+        if not newer.any():
+            return (shift_x, shift_y), None
+        block[newer] = cells[newer]
+        xs, ys = np.nonzero(newer)
+        return (shift_x, shift_y), (x_min + xs.min(), x_min + xs.max() + 1, y_min + ys.min(), y_min + ys.max() + 1)
+
+
 def main():
     # Run the unit tests
     unittest.main(argv=['first-arg-is-ignored'], exit=False)
@@ -18,14 +18,29 @@ License:
 from mesa.datacollection import DataCollector
 import mesa
 from mesa import Model
-import pandas as pd
+from mesa.space import PropertyLayer
+from scipy.ndimage import label
 import numpy as np
 import os
+import random
+import shutil
+import signal
+import tempfile
 from copy import copy
+from operator import attrgetter
 import json
-from .agents import RadioactivityAgent, RobotAgent, WasteAgent, RefinedAgent
+import hashlib
+from .agents import RobotAgent, WasteAgent, RefinedAgent
 from .action import Move, Drop, NoneAction
-from .variables import color_dict,direction_dict,inv_direction_dict,robot_dict
+from .writer import ChunkWriter
+from .sync import sync_tag
+from .blackboard import Blackboard, Team
+from .cache import run_key, load_summary, UNCACHED_TERMINATIONS
+from .checkpoint import save_checkpoint
+from .stall import NoProgress, IdleRobots, Budget, TERMINATION_REASONS
+from .trace import DEBUG, INFO, PICKUP, DROP, FUSION, MERGE, STATE, FINISH, CHECKPOINT, STATE_NAMES
+from .engine import ArrayEngine
+from .variables import color_dict,direction_dict,robot_dict,max_radioactivity_dict
 
 def next_color(color):
     if color=='green':
@@ -35,6 +50,24 @@ def next_color(color):
     else:
         raise Exception(f"Invalid color {color} for next color")
 
+def seed_entropy(seed):
+    '''
+    seed as np.random.SeedSequence accepts it: None, non negative integers and lists of them are kept, a string of digits
+    (the seed field of the app) is read as the integer it holds, anything else becomes a stable 64 bit hash of its str
+    '''
+    if seed is None:
+        return None
+    if isinstance(seed, (list, tuple)):
+        return [seed_entropy(part) for part in seed]
+    if isinstance(seed, (int, np.integer)) and seed >= 0:
+        return int(seed)
+    if isinstance(seed, str) and seed.strip().isdigit():
+        return int(seed.strip())
+    return int.from_bytes(hashlib.sha256(str(seed).encode()).digest()[:8], "little")
+
+def transporting_reporter(agent):
+    return copy(agent.knowledge['transporting'])#beware of lists :)
+
 class WasteRetrievalModel(Model):
     def __init__(self,
                  num_green = 1,
@@ -49,8 +82,22 @@ class WasteRetrievalModel(Model):
                  strategy='refined',
                  save_path = "results/",
                  max_steps = 20000,
-                 finish_threshold = 0.9):
-        super().__init__(seed=seed)
+                 finish_threshold = 0.9,
+                 stream_every = None,
+                 changes_only = False,
+                 engine = 'objects',
+                 blackboard = False,
+                 trace = None,
+                 profiler = None,
+                 checkpoint_every = None,
+                 checkpoint_on_signal = False,
+                 stall_steps = None,
+                 idle_steps = None,
+                 wall_budget = None,
+                 cpu_budget = None):
+        super().__init__(seed=seed_entropy(seed))
+        self.create_rng_streams(seed)
+        self.agent_index = {} # unique_id -> agent, kept up to date by register_agent/deregister_agent
         if(width%3!=0):
             raise Exception("The indicated width is not a multiple of 3")
         self.save_path = save_path
@@ -67,6 +114,23 @@ class WasteRetrievalModel(Model):
         self.potential_red =  num_waste_green // 4 + num_waste_yellow // 2 + num_waste_red
         self.current_step = 0
         self.finished = False
+        # why the run ended, one of stall.TERMINATION_REASONS
+        self.termination = None
+        # early termination of runs that cannot finish or use too much time, see src/stall.py
+        self.stall_steps = stall_steps
+        self.idle_steps = idle_steps
+        self.wall_budget = wall_budget
+        self.cpu_budget = cpu_budget
+        self.stall_detectors = []
+        if stall_steps is not None:
+            self.stall_detectors.append(NoProgress(stall_steps))
+        if idle_steps is not None:
+            self.stall_detectors.append(IdleRobots(idle_steps))
+        if wall_budget is not None or cpu_budget is not None:
+            self.stall_detectors.append(Budget(wall_budget, cpu_budget))
+        self.stream_every = stream_every
+        self.changes_only = changes_only
+        self.run_dir = None
         self.grid = mesa.space.MultiGrid(width, height,torus = False)
         if strategy == 'communication':
             self.communicate = True
@@ -74,12 +138,24 @@ class WasteRetrievalModel(Model):
         else:
             self.communicate = False
             self.strategy = strategy
+        if engine not in ('objects','arrays'):
+            raise ValueError(f"Unknown engine {engine!r}, expected 'objects' or 'arrays'")
+        if engine == 'arrays' and self.communicate:
+            raise ValueError("The 'arrays' engine does not support the communication strategy")
+        self.engine_name = engine
+        if blackboard and not self.communicate:
+            raise ValueError("The blackboard is only used by the communication strategy")
     
         
 
         #self.schedule = mesa.time.RandomActivation(self)
         self.disposed_waste_count = 0
+        # live counters, updated in do() so that reporters never have to scan the agents
+        self.waste_count = {color:0 for color in color_dict}
+        self.robot_count = {color:0 for color in color_dict}
+        self.carried_waste_count = 0
         # Add the datacollector
+        # when streaming, the agent rows go to the ChunkWriter instead of piling up in memory
         self.datacollector = DataCollector(
             model_reporters={
                 "Green Waste": self.count_green_waste,
@@ -90,58 +166,85 @@ class WasteRetrievalModel(Model):
             },
             agenttype_reporters=
             {
-                RadioactivityAgent: {"Radioactivity": lambda a: a.radioactivity},
-
-                RobotAgent: {"Color": lambda a: a.color,
-                            "Transporting": lambda a: copy(a.knowledge['transporting']),#beware of lists :)
-                            "Position": lambda a: a.pos},
-
-                WasteAgent: {"Color": lambda a: a.color,
-                            "Picked Up": lambda a: a.picked_up,
-                            "Arrived": lambda a: a.arrived}
-            }
+                RobotAgent: {"Color": attrgetter("color"),
+                            "Transporting": transporting_reporter,
+                            "Position": attrgetter("pos")},
+
+                WasteAgent: {"Color": attrgetter("color"),
+                            "Picked Up": attrgetter("picked_up"),
+                            "Arrived": attrgetter("arrived")}
+            } if not (stream_every or changes_only) else None
         )
+        # structured event trace, see src/trace.py, call sites only emit when it is not None
+        self.trace = trace
+        # per phase timers of step(), see src/profiler.py
+        self.profiler = profiler
+        # functions called with the run directory by save_data before it is published, to add files to it
+        self.save_hooks = []
         self.running = True # Simulation starts paused
 
         self.robot_agents = []
         self.waste_agents = []
-        self.radioactivity_agents = []
         self.initialize_agents()
-        self.datacollector.collect(self)
+        # structure-of-arrays stepping for large robot counts, see src/engine.py
+        self.engine = ArrayEngine(self) if engine == 'arrays' else None
+        # robots that met share one internal map, see src/blackboard.py
+        self.blackboard = Blackboard(self.robot_agents) if blackboard else None
         self.create_config()
+        self.writer = None
+        if self.stream_every or self.changes_only:
+            run_dir = self.get_run_dir()
+            with open(f"{run_dir}/config.json", "w") as f:
+                json.dump(self.config, f)
+            self.writer = ChunkWriter(run_dir, flush_every=self.stream_every or 100, changes_only=self.changes_only)
+        self.collect_data()
+        # see checkpoint(), restore a run with checkpoint.load_checkpoint
+        self.checkpoint_every = checkpoint_every
+        self.checkpoint_on_signal = checkpoint_on_signal
+        self.pending_signal = None
+        self.previous_handlers = {}
+        if checkpoint_on_signal:
+            self.install_signal_handlers()
+    def create_rng_streams(self, seed):
+        '''
+        Independent random streams derived from seed (from OS entropy if None, self.seed then holds it so that the
+        run can be reproduced): layout_rng places the radioactivity and the agents, schedule_rng orders the robots
+        each step, decision_random and decision_rng draw the choices of the agents and of the array engine.
+        Nothing draws from the global np.random / random state, so runs are reproducible and parallel runs independent.
+        Any seed is accepted, see seed_entropy.
+        '''
+        seed_sequence = np.random.SeedSequence(seed_entropy(seed))
+        self.seed = seed_sequence.entropy
+        layout, schedule, decisions, batch_decisions = seed_sequence.spawn(4)
+        self.layout_rng = np.random.default_rng(layout)
+        self.schedule_rng = np.random.default_rng(schedule)
+        self.decision_random = random.Random(int(decisions.generate_state(1, np.uint64)[0]))
+        self.decision_rng = np.random.default_rng(batch_decisions)
+
     def initialize_agents(self):
-        self.grid = mesa.space.MultiGrid(self.width, self.height, torus=False)
+        self.radioactivity_layer = PropertyLayer("radioactivity", self.width, self.height, default_value=0.0, dtype=float)
+        self.grid = mesa.space.MultiGrid(self.width, self.height, torus=False, property_layers=self.radioactivity_layer)
         self.robot_agents = []
         self.waste_agents = []
-        self.radioactivity_agents = []
-        # initialize the radioactivity agents
-        for zone in range(3):
-            for i in range(zone*self.width//3,(zone+1)*self.width//3):
-                for j in range(self.height):
-                    if i==self.width - 1 and j == self.height - 1:
-                        # Red waste cell
-                        agent = RadioactivityAgent(self,radioactivity=2)
-                        self.grid.place_agent(agent, (i, j))
-                        self.radioactivity_agents.append(agent)
-                    else:
-                        agent = RadioactivityAgent(self,radioactivity=zone/3 + np.random.random()/3)
-                        self.grid.place_agent(agent, (i, j))
-                        self.radioactivity_agents.append(agent)
+        self.waste_count = {color:0 for color in color_dict}
+        self.robot_count = {color:0 for color in color_dict}
+        self.carried_waste_count = 0
+        self.initialize_radioactivity()
 
 
         random_pos_zone1 = set()
         while len(random_pos_zone1) < self.num_waste_green + self.num_green:
-            random_pos_zone1.add((np.random.randint(self.width//3),np.random.randint(self.height)))
+            random_pos_zone1.add((int(self.layout_rng.integers(self.width//3)),int(self.layout_rng.integers(self.height))))
         random_pos_zone1 = list(random_pos_zone1)
 
         random_pos_zone2 = set()
         while len(random_pos_zone2) < self.num_waste_yellow + self.num_yellow:
-            random_pos_zone2.add((np.random.randint(self.width//3,2*self.width//3),np.random.randint(self.height)))
+            random_pos_zone2.add((int(self.layout_rng.integers(self.width//3,2*self.width//3)),int(self.layout_rng.integers(self.height))))
         random_pos_zone2 = list(random_pos_zone2)
 
         random_pos_zone3 = set()
         while len(random_pos_zone3) < self.num_waste_red + self.num_red:
-            random_pos_zone3.add((np.random.randint(2*self.width//3,self.width),np.random.randint(self.height)))
+            random_pos_zone3.add((int(self.layout_rng.integers(2*self.width//3,self.width)),int(self.layout_rng.integers(self.height))))
         random_pos_zone3 = list(random_pos_zone3)
 
 
@@ -177,57 +280,58 @@ class WasteRetrievalModel(Model):
             self.grid.place_agent(agent,pos)
             self.robot_agents.append(agent)
 
+        for agent in self.waste_agents:
+            self.waste_count[agent.color] += 1
+            self.cell_layers[agent.pos][2 + color_dict[agent.color]] += 1
+        for agent in self.robot_agents:
+            self.robot_count[agent.color] += 1
+            self.cell_layers[agent.pos][1] += 1
+
+
+    def initialize_radioactivity(self):
+        '''
+        radioactivity is a static (width, height) field indexed by grid position,
+        zone k of the map is drawn uniformly in [k/3,(k+1)/3[ and the disposal cell is set to 2.
+        passable[color] tells where a robot of that color is allowed to walk.
+        '''
+        self.radioactivity = self.radioactivity_layer.data
+        zones = np.arange(self.width) // (self.width // 3)
+        self.radioactivity[:] = zones[:,None]/3 + self.layout_rng.random((self.width,self.height))/3
+        # Red waste cell
+        self.radioactivity[self.width - 1,self.height - 1] = 2
+        self.passable = {color: self.radioactivity <= max_radioactivity_dict[color] for color in color_dict}
+        # what robots observe on each cell: radioactivity, number of robots, number of green, yellow and red wastes
+        # lying there (neither carried nor disposed), kept up to date by move() and do()
+        self.cell_layers = np.zeros((self.width,self.height,5))
+        self.cell_layers[:,:,0] = self.radioactivity
 
     def step_agents(self):
-        shuffled = np.random.permutation(self.robot_agents)
+        profiler = self.profiler
+        if self.engine is not None:
+            start = profiler.start() if profiler is not None else None
+            self.engine.step()
+            if profiler is not None:
+                profiler.stop('engine', start)
+            return
+        shuffled = [self.robot_agents[i] for i in self.schedule_rng.permutation(len(self.robot_agents))]
         ### Communication ###
         if self.communicate:
-            seen_pairs = set()
-            agent_tuples = []
-
-            for agent1 in self.robot_agents:
-                x1, y1 = agent1.pos
-                neighbors = self.grid.get_neighborhood((x1, y1), moore=True, include_center=False)
-
-                for (nx, ny) in neighbors:
-                    x_offset = nx - x1
-                    y_offset = ny - y1
-
-                    cellmates = self.grid.get_cell_list_contents([(nx, ny)])
-                    for agent2 in cellmates:
-                        if isinstance(agent2, type(agent1)):
-                            pair_id = tuple(sorted((id(agent1), id(agent2))))
-                            if pair_id in seen_pairs:
-                                continue
-                            seen_pairs.add(pair_id)
-
-                            agent2_x = agent2.knowledge["agent_x"]
-                            agent2_y = agent2.knowledge["agent_y"]
-                            agent1_in_agent2 = (agent2_x - x_offset, agent2_y - y_offset)
-
-                            agent_tuples.append((agent1, agent2, agent1_in_agent2))
-
-            for (agent1, agent2, agent1_in_agent2) in agent_tuples:
-                merged, agent1_in_merged, agent2_in_merged = self.merge_agents_knowledge(
-                    agent1=agent1,
-                    agent2=agent2,
-                    agent1_in_agent2=agent1_in_agent2,
-                )
-                agent1.knowledge['internal_map'] = merged
-                agent2.knowledge['internal_map'] = merged
-
-                agent1.knowledge['agent_x'] = agent1_in_merged[0]
-                agent2.knowledge['agent_x'] = agent2_in_merged[0]
-
-                agent1.knowledge['agent_y'] = agent1_in_merged[1]
-                agent2.knowledge['agent_y'] = agent2_in_merged[1]
-                
+            start = profiler.start() if profiler is not None else None
+            clusters = self.communication_clusters()
+            if profiler is not None:
+                start = profiler.stop('communication', start)
+            for cluster in clusters:
+                if self.blackboard is not None:
+                    exchanged = self.blackboard.join(cluster)
+                else:
+                    exchanged = self.merge_cluster_knowledge(cluster)
+                if self.trace is not None and exchanged:
+                    self.trace.emit(self.current_step, DEBUG, MERGE, cluster[0].unique_id, len(cluster), exchanged)
+            if profiler is not None:
+                profiler.stop('merge', start)
 
         for agent in shuffled:
-            #find agent position and find the neighbours
-            neighbour_squares = self.grid.get_neighborhood(
-            agent.pos, moore=True, include_center=True
-            )
+            start = profiler.start() if profiler is not None else None
             curr_x,curr_y = agent.pos
 
             # If the agent share this cell with another agent of the same color
@@ -243,25 +347,88 @@ class WasteRetrievalModel(Model):
                                 transported_waste_id = cellmate.knowledge['transporting'][0]
                                 cellmate.drop(transported_waste_id)
                                 agent.pickup(transported_waste_id)
-            observation = {}
-            for (x,y) in neighbour_squares:
-                #get all agents on that square
-                cellmates = self.grid.get_cell_list_contents([(x,y)])
-                observation[(x-curr_x,y-curr_y)] = cellmates
+            if profiler is not None:
+                start = profiler.stop('handoff', start, agent)
+            observation = self.observe(agent.pos)
+            if profiler is not None:
+                profiler.stop('observe', start, agent)
             #to change
-            agent.step_agent(observation)
+            state = agent.state
+            if profiler is None:
+                agent.step_agent(observation)
+            else:
+                self.profiled_step_agent(agent,observation)
+            if self.trace is not None and agent.state != state:
+                self.trace.emit(self.current_step, DEBUG, STATE, agent.unique_id, STATE_NAMES.index(agent.state))
+
+    def profiled_step_agent(self,agent,observation):
+        '''BaseAgent.step_agent with each of its phases timed by the profiler'''
+        start = self.profiler.start()
+        agent.update_knowledge(observation)
+        start = self.profiler.stop('update_knowledge', start, agent)
+        action = agent.deliberate()
+        start = self.profiler.stop('deliberate', start, agent)
+        self.do(agent,action)
+        self.profiler.stop('do', start, agent)
+
+    def observe(self,pos):
+        '''
+        3x3 observation around pos clipped to the grid, as expected by RobotAgent.update_knowledge:
+        a view of cell_layers and the bounds of that view as offsets from pos.
+        '''
+        x,y = pos
+        x_min,x_max = max(x - 1,0),min(x + 2,self.width)
+        y_min,y_max = max(y - 1,0),min(y + 2,self.height)
+        return self.cell_layers[x_min:x_max,y_min:y_max],(x_min - x,x_max - x,y_min - y,y_max - y)
 
     def move(self,agent,direction):
         new_agent_pos = (agent.pos[0] + direction_dict[direction][0],  agent.pos[1] + direction_dict[direction][1])
+        self.cell_layers[agent.pos][1] -= 1
+        self.cell_layers[new_agent_pos][1] += 1
         self.grid.move_agent(agent,new_agent_pos)
         waste_ids = agent.knowledge['transporting']
         for _id in waste_ids:
             self.grid.move_agent(self.get_agent_by_id(_id),new_agent_pos)
 
+    def register_agent(self,agent):
+        super().register_agent(agent)
+        self.agent_index[agent.unique_id] = agent
+
+    def deregister_agent(self,agent):
+        super().deregister_agent(agent)
+        self.agent_index.pop(agent.unique_id,None)
+
+    def add_robot(self, color, pos=None):
+        '''
+        Add a robot of the model's strategy at pos, or on an empty cell of its zone drawn from layout_rng.
+        The arrays engine keeps its own robot arrays and does not support it.
+        '''
+        if self.engine is not None:
+            raise ValueError("Robots cannot be added to a model using the 'arrays' engine")
+        if pos is None:
+            x_min = color_dict[color] * self.width // 3
+            pos = (int(self.layout_rng.integers(x_min, x_min + self.width // 3)), int(self.layout_rng.integers(self.height)))
+            while not self.grid.is_cell_empty(pos):
+                pos = (int(self.layout_rng.integers(x_min, x_min + self.width // 3)), int(self.layout_rng.integers(self.height)))
+        agent = eval(robot_dict[self.strategy])(self,color=color)
+        self.grid.place_agent(agent,pos)
+        self.robot_agents.append(agent)
+        self.robot_count[color] += 1
+        self.cell_layers[pos][1] += 1
+        setattr(self, f"num_{color}", getattr(self, f"num_{color}") + 1)
+        if self.blackboard is not None:
+            agent.team = Team(agent)
+        return agent
+
+    def remove_agent(self,agent):
+        '''remove an agent from the grid and from the model'''
+        self.grid.remove_agent(agent)
+        if isinstance(agent,WasteAgent):
+            self.waste_agents.remove(agent)
+        agent.remove()
+
     def get_agent_by_id(self,id):
-        for agent in self.agents:
-            if id == agent.unique_id:
-                return agent
+        return self.agent_index.get(id)
 
     def do(self,agent,action):
         '''
@@ -277,11 +444,16 @@ class WasteRetrievalModel(Model):
                 agent.drop(action.drop_id)
                 dropped = self.get_agent_by_id(action.drop_id)
                 dropped.picked_up = False
+                self.carried_waste_count -= 1
 
                 #check if its arrived
                 if dropped.color == "red" and dropped.pos == (self.width -1,self.height-1):
                     dropped.arrived = True
                     self.disposed_waste_count += 1
+                else:
+                    self.cell_layers[dropped.pos][2 + color_dict[dropped.color]] += 1
+                if self.trace is not None:
+                    self.trace.emit(self.current_step, DEBUG, DROP, agent.unique_id, dropped.unique_id, dropped.arrived)
                 #print(f"Dropping waste {action.drop_id}")
 
             if isinstance(action,Move):
@@ -295,97 +467,114 @@ class WasteRetrievalModel(Model):
                 and not cellmate.arrived and len(agent.knowledge['transporting'])<=1:
                     agent.pickup(cellmate.unique_id)
                     cellmate.picked_up = True
-                    print(f"picking up {cellmate.unique_id} of color {cellmate.color}")
+                    self.carried_waste_count += 1
+                    self.cell_layers[cellmate.pos][2 + color_dict[cellmate.color]] -= 1
+                    if self.trace is not None:
+                        self.trace.emit(self.current_step, DEBUG, PICKUP, agent.unique_id, cellmate.unique_id)
 
             #transform wastes when two in the same bag
             if len(agent.knowledge['transporting']) == 2:
                 #print(agent.knowledge['transporting'])
                 id1,id2 = agent.knowledge['transporting'][0],agent.knowledge['transporting'][1]
-                if self.get_agent_by_id(id1).color == 'red' or self.get_agent_by_id(id1).color != self.get_agent_by_id(id2).color :
+                waste1,waste2 = self.get_agent_by_id(id1),self.get_agent_by_id(id2)
+                if waste1.color == 'red' or waste1.color != waste2.color :
                     pass
                 else:
-                    #print("changing color of agent", self.get_agent_by_id(id1).unique_id,id1)
-                    self.get_agent_by_id(id1).color = next_color(self.get_agent_by_id(id1).color)
+                    #print("changing color of agent", waste1.unique_id,id1)
+                    self.waste_count[waste1.color] -= 2
+                    waste1.color = next_color(waste1.color)
+                    self.waste_count[waste1.color] += 1
+                    self.carried_waste_count -= 1
                     #print('removing agent', id2)
-                    self.grid.remove_agent(self.get_agent_by_id(id2))
-                    self.agents.remove(self.get_agent_by_id(id2))
+                    self.remove_agent(waste2)
                     agent.knowledge['transporting'].pop()
+                    if self.trace is not None:
+                        self.trace.emit(self.current_step, DEBUG, FUSION, agent.unique_id, id1, id2)
 
     def step(self):
         if self.running and not self.finished:
             self.step_agents()
             self.current_step += 1
-            self.datacollector.collect(self)
+            if self.profiler is None:
+                self.collect_data()
+            else:
+                start = self.profiler.start()
+                self.collect_data()
+                self.profiler.stop('collect', start)
+                self.profiler.steps += 1
             self.check_finished()
+            if not self.finished and (self.pending_signal is not None
+                                      or (self.checkpoint_every and self.current_step % self.checkpoint_every == 0)):
+                self.checkpoint()
+            if self.pending_signal is not None:
+                self.forward_signal()
         else:
             pass # Model is paused, do nothing
         
-    import numpy as np
-
-    def merge_agents_knowledge(self,agent1, agent2, agent1_in_agent2, fill_value=-1):
-        map1 = agent1.knowledge_map
-        map2 = agent2.knowledge_map
-        h1, w1, c = map1.shape
-        h2, w2, _ = map2.shape
-
-        assert c == 6, "Each map is expected to have 6 channels"
-
-        ref1 = (agent1.knowledge['agent_y'], agent1.knowledge['agent_x'])  # (row, col)
-        agent2_pos = (agent2.knowledge['agent_y'], agent2.knowledge['agent_x'])
-        ref2 = (agent1_in_agent2[1], agent1_in_agent2[0])  # (row, col)
-
-        dy = ref1[0] - ref2[0]
-        dx = ref1[1] - ref2[1]
-
-        top = min(0, dy)
-        left = min(0, dx)
-        bottom = max(h1, dy + h2)
-        right = max(w1, dx + w2)
-        H = bottom - top
-        W = right - left
-
-        # Initialize merged map: zeros for first 5 channels, fill_value (-1) for last
-        merged = np.zeros((H, W, c), dtype=map1.dtype)
-        merged[..., 5] = fill_value
-
-        merged_age = np.full((H, W), np.inf)
-
-        y1_offset = -top
-        x1_offset = -left
-        y2_offset = y1_offset + dy
-        x2_offset = x1_offset + dx
-
-        # Insert map1
-        m1_slice = merged[y1_offset:y1_offset+h1, x1_offset:x1_offset+w1]
-        m1_age = map1[..., 5]
-        mask1 = m1_age != -1
-        m1_slice[mask1] = map1[mask1]
-        merged_age[y1_offset:y1_offset+h1, x1_offset:x1_offset+w1][mask1] = m1_age[mask1]
-
-        # Insert newer data from map2
-        m2_age = map2[..., 5]
-        y2s, x2s = np.meshgrid(np.arange(h2), np.arange(w2), indexing="ij")
-        global_y = y2s + y2_offset
-        global_x = x2s + x2_offset
-        known_mask = m2_age != -1
-        newer_mask = known_mask & (m2_age < merged_age[global_y, global_x])
-        merged[global_y[newer_mask], global_x[newer_mask]] = map2[newer_mask]
-        merged_age[global_y[newer_mask], global_x[newer_mask]] = m2_age[newer_mask]
-
-        agent1_in_merged = (ref1[1] + x1_offset, ref1[0] + y1_offset)
-        agent2_in_merged = (agent2_pos[1] + x2_offset, agent2_pos[0] + y2_offset)
-
-        return merged, agent1_in_merged, agent2_in_merged
-
+    def communication_clusters(self):
+        '''
+        Groups of at least two robots that can communicate this step, two robots communicate when they are on the same
+        or on neighbouring cells, transitively. Found by labelling the 8-connected components of the robot occupancy grid.
+        '''
+        positions = np.array([robot.pos for robot in self.robot_agents]).reshape(-1, 2)
+        occupancy = np.zeros((self.width, self.height), dtype=bool)
+        occupancy[positions[:,0], positions[:,1]] = True
+        labels, _ = label(occupancy, structure=np.ones((3,3)))
+        robot_labels = labels[positions[:,0], positions[:,1]]
+        order = np.argsort(robot_labels, kind='stable')
+        _, starts, counts = np.unique(robot_labels[order], return_index=True, return_counts=True)
+        return [[self.robot_agents[i] for i in order[start:start + count]] for start, count in zip(starts, counts) if count >= 2]
+
+    def merge_cluster_knowledge(self, robots):
+        '''
+        Exchange knowledge between a cluster of robots, in grid coordinates, keeping the freshest information
+        (latest seen step) of each cell.
+        Each robot only sends the cells it changed since its last merge with the other robots of the cluster
+        (its whole map if it never met one of them), so robots that stay together exchange almost nothing.
+        Returns the number of cells exchanged.
+        '''
+        tag = sync_tag(self.current_step)
+        boxes = []
+        for robot in robots:
+            last_sync = [robot.knowledge['last_sync'].get(other.unique_id) for other in robots if other is not robot]
+            if None in last_sync:
+                x, y = robot.map_origin()
+                len_x, len_y = robot.knowledge['internal_map'].shape[:2]
+                boxes.append((x, x + len_x, y, y + len_y))
+            else:
+                boxes.append(robot.knowledge['changes'].since(min(last_sync)))
+        sending = [(robot, box) for robot, box in zip(robots, boxes) if box is not None]
+        exchanged = 0
+        if sending:
+            x_grid = min(box[0] for _, box in sending)
+            y_grid = min(box[2] for _, box in sending)
+            len_x = max(box[1] for _, box in sending) - x_grid
+            len_y = max(box[3] for _, box in sending) - y_grid
+            merged = np.zeros((len_x, len_y, robots[0].knowledge['internal_map'].shape[2]))
+            merged[:,:,-1] = -1
+            exchanged = len_x * len_y
+            for robot, (x_min, x_max, y_min, y_max) in sending:
+                x_origin, y_origin = robot.map_origin()
+                cells = robot.knowledge['internal_map'][x_min - x_origin:x_max - x_origin, y_min - y_origin:y_max - y_origin]
+                block = merged[x_min - x_grid:x_max - x_grid, y_min - y_grid:y_max - y_grid]
+                newer = cells[:,:,-1] > block[:,:,-1]
+                block[newer] = cells[newer]
+            for robot in robots:
+                robot.merge_knowledge(merged, x_grid, y_grid, tag)
+        for robot in robots:
+            last_sync = robot.knowledge['last_sync']
+            last_sync.update((other.unique_id, tag) for other in robots if other is not robot)
+            robot.knowledge['changes'].forget(min(last_sync.values()))
+        return exchanged
 
     def count_green_waste(self):
-        return sum(1 for agent in self.agents if isinstance(agent, WasteAgent) and agent.color == 'green')
+        return self.waste_count['green']
 
     def count_yellow_waste(self):
-        return sum(1 for agent in self.agents if isinstance(agent, WasteAgent) and agent.color == 'yellow')
+        return self.waste_count['yellow']
 
     def count_red_waste(self):
-        return sum(1 for agent in self.agents if isinstance(agent, WasteAgent) and agent.color == 'red')
+        return self.waste_count['red']
 
     def count_disposed_waste(self):
         # Count waste that has been properly disposed (you may need to add a flag to track this)
@@ -394,30 +583,167 @@ class WasteRetrievalModel(Model):
     def calculate_progress(self):
         return self.disposed_waste_count / self.potential_red
     
+    def stats(self):
+        '''snapshot of the live counters, cheap enough to be taken every step or every frame'''
+        return {
+            "Green Waste": self.waste_count['green'],
+            "Yellow Waste": self.waste_count['yellow'],
+            "Red Waste": self.waste_count['red'],
+            "Disposed Waste": self.disposed_waste_count,
+            "Total Waste": sum(self.waste_count.values()),
+            "Carried Waste": self.carried_waste_count,
+            "Green Robots": self.robot_count['green'],
+            "Yellow Robots": self.robot_count['yellow'],
+            "Red Robots": self.robot_count['red'],
+            "Total Robots": sum(self.robot_count.values()),
+            "Progress": self.calculate_progress(),
+        }
+
     def check_finished(self):
-        if self.calculate_progress() >= self.finish_threshold or self.current_step >= self.max_steps:
+        if self.calculate_progress() >= self.finish_threshold:
+            self.termination = "finish_threshold"
+        elif self.current_step >= self.max_steps:
+            self.termination = "max_steps"
+        else:
+            for detector in self.stall_detectors:
+                self.termination = detector.update(self)
+                if self.termination is not None:
+                    break
+        if self.termination is not None:
             self.finished = True
-            print(f"Finishing simulation due to progress: {self.calculate_progress()} or step: {self.current_step}")
+            print(f"Finishing simulation ({self.termination}) at progress: {self.calculate_progress()} and step: {self.current_step}")
+            if self.trace is not None:
+                self.trace.emit(self.current_step, INFO, FINISH, -1, self.disposed_waste_count,
+                                TERMINATION_REASONS.index(self.termination))
             self.running = False
             self.save_data()
     
+    def collect_data(self):
+        self.datacollector.collect(self)
+        if self.writer is not None:
+            self.writer.record(self)
+
+    def completed_run_dir(self):
+        '''
+        Content addressed directory of this run, save_path/simulation_<run_key(config)>. It only exists once a run
+        with the same config and code has completed, its summary.json then holds the final step and stats.
+        '''
+        return os.path.join(self.save_path, f"simulation_{run_key(self.config)}")
+
+    def get_run_dir(self):
+        '''
+        directory the run writes to, created the first time it is needed: a private temporary directory next to
+        completed_run_dir(), renamed to it by save_data once everything is written
+        '''
+        if self.run_dir is None:
+            os.makedirs(self.save_path, exist_ok=True)
+            self.run_dir = tempfile.mkdtemp(prefix=f".simulation_{run_key(self.config)}.", dir=self.save_path)
+            # mkdtemp makes it private (0700), published results get the mode of any directory created by this process
+            umask = os.umask(0)
+            os.umask(umask)
+            os.chmod(self.run_dir, 0o777 & ~umask)
+        return self.run_dir
+
+    def publish_run_dir(self):
+        '''
+        atomically move the written run directory to completed_run_dir(), or next to it for a run stopped by its time
+        budget (UNCACHED_TERMINATIONS): completed_run_dir().<termination>.<suffix>, which is never reused
+        '''
+        if self.termination in UNCACHED_TERMINATIONS:
+            suffix = self.run_dir.rsplit(".", 1)[-1]
+            final_dir = f"{self.completed_run_dir()}.{self.termination}.{suffix}"
+            os.rename(self.run_dir, final_dir)
+            self.run_dir = final_dir
+            return
+        final_dir = self.completed_run_dir()
+        try:
+            os.rename(self.run_dir, final_dir)
+        except OSError:
+            if load_summary(final_dir) is None:
+                raise
+            # an identical run completed meanwhile, keep its results
+            shutil.rmtree(self.run_dir)
+        self.run_dir = final_dir
+
+    def discard(self):
+        '''stop this run without saving anything, its temporary directory is removed'''
+        self.running = False
+        if self.writer is not None:
+            self.writer.close()
+        if self.run_dir is not None and os.path.basename(self.run_dir).startswith("."):
+            shutil.rmtree(self.run_dir, ignore_errors=True)
+        self.run_dir = None
+
+    def checkpoint_path(self):
+        '''where checkpoint() saves this run, next to completed_run_dir()'''
+        return self.completed_run_dir() + ".checkpoint"
+
+    def checkpoint(self):
+        '''save the full state of the model to checkpoint_path(), it is removed once the run completes'''
+        os.makedirs(self.save_path, exist_ok=True)
+        save_checkpoint(self, self.checkpoint_path())
+        if self.trace is not None:
+            self.trace.emit(self.current_step, INFO, CHECKPOINT, -1)
+
+    def install_signal_handlers(self):
+        '''
+        On SIGINT/SIGTERM the current step is finished and checkpointed before the signal gets to the handler
+        that was installed before (KeyboardInterrupt for SIGINT, termination for SIGTERM by default).
+        Signal handlers can only be installed from the main thread.
+        '''
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            self.previous_handlers[signum] = signal.signal(signum, self.on_signal)
+
+    def on_signal(self, signum, frame):
+        self.pending_signal = signum
+
+    def forward_signal(self):
+        signum = self.pending_signal
+        self.pending_signal = None
+        for handled, handler in self.previous_handlers.items():
+            signal.signal(handled, handler)
+        self.previous_handlers = {}
+        signal.raise_signal(signum)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # signal handlers belong to the process, load_checkpoint installs them again
+        state["pending_signal"] = None
+        state["previous_handlers"] = {}
+        # set up by the caller of the run, which sets them up again after a restore
+        state["save_hooks"] = []
+        return state
+
     def save_data(self):
         # Save the data to a CSV file
-        num_runs = len(os.listdir(self.save_path))
-        run_dir = self.save_path + f"simulation_{num_runs}"
-        os.makedirs(run_dir, exist_ok=True)
+        run_dir = self.get_run_dir()
         with open(f"{run_dir}/config.json", "w") as f:
-            json.dump(self.config, f)
+            json.dump({**self.config, "termination": self.termination}, f)
         model_data = self.datacollector.get_model_vars_dataframe()
         model_data.to_csv(f"{run_dir}/model.csv")
-        data_radioactivity = self.datacollector.get_agenttype_vars_dataframe(RadioactivityAgent)
-        data_radioactivity.to_csv(f"{run_dir}/agent_radioactivity.csv")
-        data_waste = self.datacollector.get_agenttype_vars_dataframe(WasteAgent)
-        data_waste.to_csv(f"{run_dir}/agent_waste.csv")
-        data_robot = self.datacollector.get_agenttype_vars_dataframe(RobotAgent)
-        data_robot.to_csv(f"{run_dir}/agent_robot.csv")
-
-        print(f"Data saved to {run_dir}")
+        #radioactivity never changes, store the field once
+        np.save(f"{run_dir}/radioactivity.npy", self.radioactivity)
+        if self.trace is not None:
+            self.trace.dump(f"{run_dir}/trace.npy")
+        if self.profiler is not None:
+            self.profiler.save(f"{run_dir}/profile.json")
+        if self.writer is not None:
+            # agent data is already on disk as .npz chunks, read it back with writer.load_table
+            self.writer.close()
+        else:
+            data_waste = self.datacollector.get_agenttype_vars_dataframe(WasteAgent)
+            data_waste.to_csv(f"{run_dir}/agent_waste.csv")
+            data_robot = self.datacollector.get_agenttype_vars_dataframe(RobotAgent)
+            data_robot.to_csv(f"{run_dir}/agent_robot.csv")
+        for hook in self.save_hooks:
+            hook(run_dir)
+        with open(f"{run_dir}/summary.json", "w") as f:
+            json.dump({"steps": self.current_step, "termination": self.termination, **self.stats()}, f)
+        self.publish_run_dir()
+        if os.path.exists(self.checkpoint_path()):
+            os.remove(self.checkpoint_path())
+
+        print(f"Data saved to {self.run_dir}")
 
     def create_config(self):
         self.config = {
@@ -431,5 +757,15 @@ class WasteRetrievalModel(Model):
             "height": self.height,
             "save_path": self.save_path,
             "max_steps": self.max_steps,
-            "finish_threshold": self.finish_threshold
+            "finish_threshold": self.finish_threshold,
+            "seed": self.seed,
+            "strategy": "communication" if self.communicate else self.strategy,
+            "engine": self.engine_name,
+            "blackboard": self.blackboard is not None,
+            "stream_every": self.stream_every,
+            "changes_only": self.changes_only,
+            "stall_steps": self.stall_steps,
+            "idle_steps": self.idle_steps,
+            "wall_budget": self.wall_budget,
+            "cpu_budget": self.cpu_budget
         }
\ No newline at end of file
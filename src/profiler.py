@@ -0,0 +1,91 @@
+"""
+  ____  __  __    _              _____    _        __  ____     __
+ / ___||  \/  |  / \            | ____|  / \      |  \/  \ \   / /
+ \___ \| |\/| | / _ \    _____  |  _|   / _ \     | |\/| |\ \ / / 
+  ___) | |  | |/ ___ \  |_____| | |___ / ___ \ _  | |  | | \ V /  
+ |____/|_|  |_/_/   \_\         |_____/_/   \_( ) |_|  |_|  \_/   
+                                              |/                  
+Authors:
+   Maxime Vanderbeken
+   Etienne Andrier
+
+Date : 2025-03-19
+
+License:
+   This file is open source and may be freely used and modified,
+   provided that proper credit is given to the original authors.
+"""
+import json
+import time
+import tracemalloc
+from collections import defaultdict
+
+import pandas as pd
+
+# phases of WasteRetrievalModel.step, in execution order
+PHASES = ["communication", "merge", "handoff", "observe", "update_knowledge", "deliberate", "do", "engine", "collect"]
+
+
+class StepProfiler():
+    '''
+    Cumulated wall time of the phases of WasteRetrievalModel.step, enabled with WasteRetrievalModel(profiler=StepProfiler()).
+
+    Phases are timed with start()/stop() pairs placed by the model, only when model.profiler is not None.
+    With by_agent_type the agent phases are also broken down by the class of the agent (RobotAgent, RefinedAgent).
+    With memory, tracemalloc must be tracing: each phase also gets the bytes it allocated (peak above the memory in use
+    when it started, summed over calls) and the net change of memory in use. This slows the run down, keep it for
+    dedicated memory measurements.
+    save_data writes the profile next to the run results as profile.json.
+    '''
+    def __init__(self, by_agent_type=False, memory=False):
+        self.by_agent_type = by_agent_type
+        self.memory = memory
+        self.total = defaultdict(float)
+        self.calls = defaultdict(int)
+        self.allocated = defaultdict(int)
+        self.retained = defaultdict(int)
+        self.steps = 0
+
+    def start(self):
+        if self.memory:
+            tracemalloc.reset_peak()
+            return (time.perf_counter(), tracemalloc.get_traced_memory()[0])
+        return time.perf_counter()
+
+    def stop(self, phase, start, agent=None):
+        '''add the time elapsed since start to phase, returns a new start so that phases can be chained'''
+        key = (phase, type(agent).__name__ if self.by_agent_type and agent is not None else "")
+        self.calls[key] += 1
+        if self.memory:
+            now = time.perf_counter()
+            current, peak = tracemalloc.get_traced_memory()
+            self.total[key] += now - start[0]
+            self.allocated[key] += peak - start[1]
+            self.retained[key] += current - start[1]
+            tracemalloc.reset_peak()
+            return (now, current)
+        now = time.perf_counter()
+        self.total[key] += now - start
+        return now
+
+    def to_dataframe(self):
+        '''
+        one row per (phase, agent type): number of calls, total and mean time in seconds, share of the profiled time,
+        and with memory the allocated and retained bytes
+        '''
+        columns = ["phase", "agent_type", "calls", "total", "mean"] + (["allocated", "retained"] if self.memory else [])
+        rows = [{"phase": phase, "agent_type": agent_type, "calls": self.calls[(phase, agent_type)],
+                 "total": total, "mean": total / self.calls[(phase, agent_type)],
+                 "allocated": self.allocated[(phase, agent_type)], "retained": self.retained[(phase, agent_type)]}
+                for (phase, agent_type), total in self.total.items()]
+        profile = pd.DataFrame(rows, columns=columns)
+        profile["share"] = profile["total"] / profile["total"].sum() if len(profile) else []
+        order = profile["phase"].map(PHASES.index)
+        return profile.assign(order=order).sort_values(["order", "agent_type"]).drop(columns="order").reset_index(drop=True)
+
+    def to_dict(self):
+        return {"steps": self.steps, "by_agent_type": self.by_agent_type, "memory": self.memory, "phases": self.to_dataframe().to_dict(orient="records")}
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=1)
@@ -15,13 +15,50 @@ License:
    This file is open source and may be freely used and modified,
    provided that proper credit is given to the original authors.
 """
-from .model import WasteRetrievalModel
+import threading
+import time
+
 import matplotlib.pyplot as plt
+
+from .model import WasteRetrievalModel
 from .server import MatplotlibVisualization
-import time
-# Create the model (adjust parameters as needed)
 
-def Play():
+
+class SimulationThread(threading.Thread):
+    """
+    Steps viz.model as fast as it can while it is running, and publishes a Snapshot of it in self.latest at most
+    fps times per second (and once whenever it pauses, finishes or is replaced by a reset), the renderer draws the
+    latest one and the intermediate steps are skipped. Sleeps while the model is paused or finished.
+    """
+    def __init__(self, viz, fps=30, idle_sleep=0.02):
+        super().__init__(daemon=True)
+        self.viz = viz
+        self.period = 1 / fps
+        self.idle_sleep = idle_sleep
+        self.latest = viz.snapshot()
+        self.stopped = threading.Event()
+
+    def run(self):
+        last_publish = time.perf_counter()
+        while not self.stopped.is_set():
+            model = self.viz.model # changed by the Reset button
+            if model.running and not model.finished:
+                model.step()
+                now = time.perf_counter()
+                if now - last_publish >= self.period or not model.running:
+                    self.latest = self.viz.snapshot(model)
+                    last_publish = now
+            else:
+                if self.latest.model is not model or self.latest.step != model.current_step:
+                    self.latest = self.viz.snapshot(model)
+                self.stopped.wait(self.idle_sleep)
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def Play(fps=30):
     mod = WasteRetrievalModel(num_green = 5, num_yellow = 5, num_red = 5, num_waste_yellow = 0,num_waste_green=0,num_waste_red=1, width = 30, height = 30, strategy='refined')  # Using smaller grid for better visualization
 
 
@@ -29,12 +66,17 @@ def Play():
     viz = MatplotlibVisualization(mod)
     plt.show(block=False)
 
-    # Start interactive loop - simulation is controlled by play/pause button in visualization now
-    while True:
-        #print(viz.model.running)
-        if viz.model.running:
-            viz.model.step() # Step the model only if running is True
-            viz.render()
-        else:
-            viz.render() # Still render to update display even when paused
-            #plt.pause(0.001) # Small pause to keep UI responsive, reduce if needed
\ No newline at end of file
+    # The model is stepped in a background thread, this loop only draws its latest snapshot fps times per second
+    simulation = SimulationThread(viz, fps)
+    simulation.start()
+    shown = None
+    try:
+        while plt.fignum_exists(viz.fig.number):
+            snapshot = simulation.latest
+            if snapshot is not shown:
+                viz.render(snapshot)
+                shown = snapshot
+            # process the GUI events (buttons, zoom, hover) until the next frame instead of spinning
+            viz.fig.canvas.start_event_loop(1 / fps)
+    finally:
+        simulation.stop()
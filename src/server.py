@@ -15,13 +15,51 @@ License:
    This file is open source and may be freely used and modified,
    provided that proper credit is given to the original authors.
 """
+from collections import namedtuple
+from types import MappingProxyType
+
 import matplotlib.pyplot as plt
 import numpy as np
 from matplotlib.colors import ListedColormap
 from matplotlib.widgets import Button, Slider
 import matplotlib.transforms as transforms
 
-from .agents import RadioactivityAgent, RobotAgent, WasteAgent
+from .agents import RobotAgent, WasteAgent
+
+# marker colors of the robots and wastes of each color
+ROBOT_COLORS = {"green": "darkgreen", "yellow": "olive", "red": "darkred"}
+WASTE_COLORS = {"green": "green", "yellow": "yellow", "red": "red"}
+
+# what render draws for one step of a model: (offsets, colors) of the wastes, robots and carried wastes,
+# sub-position -> tooltip text of the agent drawn there and the statistics
+Snapshot = namedtuple("Snapshot", ["model", "step", "wastes", "robots", "carried", "tooltips", "stats"])
+
+
+def tooltip(agent, model):
+    """Text shown when hovering agent, read from the model when the snapshot is taken"""
+    if isinstance(agent, WasteAgent):
+        info = f"Waste ID: {agent.unique_id}, Type: {agent.color.capitalize()}"
+        if agent.picked_up:
+            info += f", Status: Being transported"
+    elif isinstance(agent, RobotAgent):
+        info = f"Robot ID: {agent.unique_id}, Type: {agent.color.capitalize()}"
+        carried_waste = []
+        for waste_id in agent.knowledge['transporting']:
+            model_agent = model.get_agent_by_id(waste_id)
+            if isinstance(model_agent, WasteAgent):
+                carried_waste.append(f"{model_agent.color.capitalize()} Waste (ID: {waste_id})")
+        if carried_waste:
+            info += f"\nCarrying: {', '.join(carried_waste)}"
+    else:
+        info = f"Agent ID: {agent.unique_id}"
+    return info
+
+
+def _frozen_offsets(offsets):
+    offsets = np.array(offsets, dtype=float).reshape(-1, 2)
+    offsets.flags.writeable = False
+    return offsets
+
 class MatplotlibVisualization:
     """An interactive visualization class using Matplotlib for the Waste Retrieval Model"""
 
@@ -62,11 +100,8 @@ class MatplotlibVisualization:
         # Add status text area for hover information
         self.status_text = self.fig.text(0.02, 0.02, "", bbox=dict(facecolor='white', alpha=0.7))
 
-        # Store scatter plot objects for updating
-        self.scatters = []
-
-        # Store positions and agent mappings for hover detection
-        self.agent_positions = {}  # (x, y) -> agent mapping
+        # Tooltips of the rendered snapshot for hover detection
+        self.tooltips = {}  # (x, y) -> text
 
         # Store current view limits to preserve zoom
         self.current_xlim = None
@@ -74,12 +109,11 @@ class MatplotlibVisualization:
 
         # Store text elements for updating
         self.nav_text = None
-        self.stats_text = None
-        self.legend = None
 
         # Initial background grid drawn once
         self._draw_background()
         self._add_controls() # Add control buttons and sliders
+        self._create_artists() # Agents and statistics, updated by render
 
         # Initialize params with initial slider values - FIX for AttributeError
         self.params = {
@@ -163,14 +197,15 @@ class MatplotlibVisualization:
         params = self.params
         try:
             new_model = type(self.model)(**params) # Re-initialize the model with current params
+            new_model.running = False # Ensure it starts paused, before a simulation thread can see it
             self.model = new_model
             self.button_play_pause.label.set_text('Play') # Reset button to 'Play' state
-            self.model.running = False # Ensure it starts paused
             self._draw_background() # Redraw background in case width/height changed
             self.current_xlim = self.default_xlim # Reset zoom
             self.current_ylim = self.default_ylim # Reset zoom
             self.ax.set_xlim(self.default_xlim) # Apply reset zoom
             self.ax.set_ylim(self.default_ylim) # Apply reset zoom
+            self.background = None # The next render draws the whole figure
         except Exception as e:
             print(f"Error resetting simulation: {e}")
             plt.title(f'Error: {e}', color='red') # Display error on plot
@@ -331,215 +366,148 @@ class MatplotlibVisualization:
     def _on_hover(self, event):
         """Handle hover events to display tooltips"""
         if event.inaxes != self.ax:
-            self.status_text.set_text("")
+            self._set_status("")
             return
 
         # Get the cursor position
         cursor_x, cursor_y = event.xdata, event.ydata
 
-        # Find the closest agent
-        closest_agent = None
+        # Find the closest agent of the rendered snapshot, the model itself may be stepping in another thread
+        closest_info = None
         min_distance = 0.3  # Threshold for detection
 
-        for pos, agent in self.agent_positions.items():
+        for pos, info in self.tooltips.items():
             # Calculate distance to mouse position
             distance = np.sqrt((pos[0] - cursor_x)**2 + (pos[1] - cursor_y)**2)
 
             if distance < min_distance:
                 min_distance = distance
-                closest_agent = agent
-
-        if closest_agent:
-            if isinstance(closest_agent, WasteAgent):
-                info = f"Waste ID: {closest_agent.unique_id}, Type: {closest_agent.color.capitalize()}"
-                if closest_agent.picked_up:
-                    info += f", Status: Being transported"
-            elif isinstance(closest_agent, RobotAgent):
-                info = f"Robot ID: {closest_agent.unique_id}, Type: {closest_agent.color.capitalize()}"
-                if closest_agent.knowledge['transporting']:
-                    waste_ids = closest_agent.knowledge['transporting']
-                    carried_waste = []
-                    for waste_id in waste_ids:
-                        for model_agent in self.model.agents:
-                            if isinstance(model_agent, WasteAgent) and model_agent.unique_id == waste_id:
-                                carried_waste.append(f"{model_agent.color.capitalize()} Waste (ID: {waste_id})")
-
-                    if carried_waste:
-                        info += f"\nCarrying: {', '.join(carried_waste)}"
-            else:
-                info = f"Agent ID: {closest_agent.unique_id}"
-
-            self.status_text.set_text(info)
-        else:
-            self.status_text.set_text("")
-
-    def render(self):
-        """Render the grid and agents while preserving zoom level"""
-        # Store current view limits before clearing
-        if self.current_xlim is None:
-            self.current_xlim = self.ax.get_xlim()
-        if self.current_ylim is None:
-            self.current_ylim = self.ax.get_ylim()
-
-        # Remove previous agent scatters
-        for scatter in self.scatters:
-            scatter.remove()
-        self.scatters = []
-
-        # Clear agent positions mapping
-        self.agent_positions = {}
-
-        # Remove previous legend and stats if they exist
-        if self.legend:
-            self.legend.remove()
-        if self.stats_text:
-            self.stats_text.remove()
-
-        # Collect all agents by cell for strategic positioning
-        cell_agents = {}
-        for cell_content, (x, y) in self.model.grid.coord_iter():
-            if cell_content:  # If there are agents in this cell
-                cell_agents[(x, y)] = []
-                for agent in cell_content:
-                    if not isinstance(agent, RadioactivityAgent):  # Skip radioactivity agents
-                        cell_agents[(x, y)].append(agent)
-
-        # Draw agents with sub-positions
-        for (x, y), agents in cell_agents.items():
-            # Skip if no visible agents
-            if not agents:
-                continue
-
-            # Distribute agents across sub-positions
-            for i, agent in enumerate(agents[:9]):  # Limit to 9 agents per cell
-                # Calculate sub-position
+                closest_info = info
+
+        self._set_status(closest_info or "")
+
+    def _set_status(self, text):
+        """Show text in the status box, redrawn right away since frames only come with new snapshots"""
+        if text == self.status_text.get_text():
+            return
+        self.status_text.set_text(text)
+        self._blit()
+
+    def _create_artists(self):
+        """Create the artists updated by render, one PathCollection per kind of marker, drawn by blitting"""
+        self.waste_scatter = self.ax.scatter([], [], marker='D', s=40, alpha=1.0, zorder=10, animated=True)
+        self.robot_scatter = self.ax.scatter([], [], marker='o', s=90, zorder=5, animated=True)
+        self.carried_scatter = self.ax.scatter([], [], marker='D', s=25, alpha=0.8, zorder=15, animated=True)
+        self.stats_text = plt.figtext(0.70, 0.05, "", fontsize=10, animated=True,
+                   bbox=dict(facecolor='lightgray', alpha=0.5), verticalalignment='bottom')
+        self.status_text.set_animated(True)
+        # figure without the animated artists, cached on every full draw (resize, zoom, pan, reset, buttons)
+        self.background = None
+        self.fig.canvas.mpl_connect('draw_event', self._on_draw)
+
+    def _on_draw(self, event):
+        """Cache the background after a full draw and draw the agents over it"""
+        self.background = self.fig.canvas.copy_from_bbox(self.fig.bbox)
+        self._draw_animated()
+
+    def _draw_animated(self):
+        for scatter in (self.robot_scatter, self.waste_scatter, self.carried_scatter):
+            self.ax.draw_artist(scatter)
+        self.fig.draw_artist(self.stats_text)
+        self.fig.draw_artist(self.status_text)
+
+    def _set_points(self, scatter, offsets, colors):
+        scatter.set_offsets(offsets)
+        scatter.set_facecolor(colors)
+        scatter.set_edgecolor(colors)
+
+    def snapshot(self, model=None):
+        """
+        Immutable Snapshot of what render draws for model (default: self.model). Only reads the model, so a
+        simulation thread can take it between two steps while the GUI thread renders an older one.
+        """
+        model = self.model if model is None else model
+        # Cells holding agents, in the order of the grid (sub-positions follow the order of the agents in a cell)
+        cells = {agent.pos: None for agent in model.robot_agents + model.waste_agents if agent.pos is not None}
+
+        tooltips = {}
+        waste_offsets, waste_colors = [], []
+        robot_offsets, robot_colors = [], []
+        carried_offsets, carried_colors = [], []
+        for (x, y) in cells:
+            # Distribute agents across sub-positions, limit to 9 agents per cell
+            for i, agent in enumerate(model.grid.get_cell_list_contents([(x, y)])[:9]):
                 dx, dy = self.sub_positions[i]
                 sub_x, sub_y = x + dx, y + dy
-
                 if isinstance(agent, WasteAgent):
-                    marker = 'D'  # Diamond for waste
-                    size = 40
-                    if agent.color == "green":
-                        color = "green"
-                    elif agent.color == "yellow":
-                        color = "yellow"
-                    else:  # red
-                        color = "red"
-
-                    # If picked up, don't render here (it will be shown on top of robot)
+                    # If picked up, don't render here (it is shown on top of the robot)
                     if not agent.picked_up:
-                        scatter = self.ax.scatter(sub_x, sub_y, c=color, marker=marker, s=size, alpha=1.0,
-                                                 zorder=10)
-                        self.scatters.append(scatter)
-                        # Store position for hover detection
-                        self.agent_positions[(sub_x, sub_y)] = agent
-
+                        waste_offsets.append((sub_x, sub_y))
+                        waste_colors.append(WASTE_COLORS[agent.color])
+                        tooltips[(sub_x, sub_y)] = tooltip(agent, model)
                 elif isinstance(agent, RobotAgent):
-                    marker = 'o'  # Circle for robots
-                    if agent.color == "green":
-                        color = "darkgreen"
-                    elif agent.color == "yellow":
-                        color = "olive"
-                    else:  # red
-                        color = "darkred"
-
-                    # Draw the robot
-                    scatter = self.ax.scatter(sub_x, sub_y, c=color, marker=marker, s=90,
-                                             zorder=5)
-                    self.scatters.append(scatter)
-                    # Store position for hover detection
-                    self.agent_positions[(sub_x, sub_y)] = agent
-
-                    # If carrying waste, draw waste on top
-                    if agent.knowledge['transporting']:
-                        # Get the first waste being transported
-                        waste_color = None
-                        waste_agent = None
-                        for waste_id in agent.knowledge['transporting']:
-                            # Find the waste in the model's agent list
-                            for model_agent in self.model.agents:
-                                if isinstance(model_agent, WasteAgent) and model_agent.unique_id == waste_id:
-                                    waste_color = model_agent.color
-                                    waste_agent = model_agent
-                                    break
-                            if waste_color:
-                                break
-
-                        if waste_color:
-                            # Draw smaller waste on top of robot
-                            if waste_color == "green":
-                                w_color = "green"
-                            elif waste_color == "yellow":
-                                w_color = "yellow"
-                            else:  # red
-                                w_color = "red"
-
-                            # Draw waste slightly above robot
-                            scatter = self.ax.scatter(sub_x, sub_y + 0.1, c=w_color, marker='D', s=25, alpha=0.8,
-                                                    zorder=15)
-                            self.scatters.append(scatter)
-                            if waste_agent:
-                                # Store position for hover detection
-                                self.agent_positions[(sub_x, sub_y + 0.1)] = waste_agent
-
-        # Add legend to the right of the grid
-        '''
-        legend_elements = [
-            plt.Line2D([0], [0], marker='o', color='w', markerfacecolor='darkgreen', markersize=12, label='Green Robot'),
-            plt.Line2D([0], [0], marker='o', color='w', markerfacecolor='olive', markersize=12, label='Yellow Robot'),
-            plt.Line2D([0], [0], marker='o', color='w', markerfacecolor='darkred', markersize=12, label='Red Robot'),
-            plt.Line2D([0], [0], marker='D', color='w', markerfacecolor='green', markersize=8, label='Green Waste'),
-            plt.Line2D([0], [0], marker='D', color='w', markerfacecolor='yellow', markersize=8, label='Yellow Waste'),
-            plt.Line2D([0], [0], marker='D', color='w', markerfacecolor='red', markersize=8, label='Red Waste'),
-            plt.Line2D([0], [0], marker='o', color='w', markerfacecolor='darkgreen', markersize=12, label='Robot with Waste',
-                      markeredgecolor='darkgreen'),
-            plt.Line2D([0], [0], marker='D', color='w', markerfacecolor='green', markersize=6, alpha=0.8, label='Carried Waste')
-        ]'''
-
-        # Position the legend outside the grid on the right side
-        #self.legend = self.ax.legend(handles=legend_elements, loc='center left', bbox_to_anchor=(1.02, 0.5))
-
-        # Count agents by type for statistics
-        green_waste = sum(1 for agent in self.model.agents if isinstance(agent, WasteAgent) and agent.color == 'green')
-        yellow_waste = sum(1 for agent in self.model.agents if isinstance(agent, WasteAgent) and agent.color == 'yellow')
-        red_waste = sum(1 for agent in self.model.agents if isinstance(agent, WasteAgent) and agent.color == 'red')
-        disposed_waste = self.model.disposed_waste_count
-
-        # Count carried waste
-        carried_waste = sum(1 for agent in self.model.agents if isinstance(agent, WasteAgent) and agent.picked_up)
-
-        # Count robots by type
-        green_robots = sum(1 for agent in self.model.agents if isinstance(agent, RobotAgent) and agent.color == 'green')
-        yellow_robots = sum(1 for agent in self.model.agents if isinstance(agent, RobotAgent) and agent.color == 'yellow')
-        red_robots = sum(1 for agent in self.model.agents if isinstance(agent, RobotAgent) and agent.color == 'red')
-
-        # Display statistics in a text box on the right side of the figure
-        stats_text = (
-            "STATISTICS\n\n"
-            f"Green Waste: {green_waste}\n"
-            f"Yellow Waste: {yellow_waste}\n"
-            f"Red Waste: {red_waste}\n"
-            f"Disposed Waste: {disposed_waste}\n"
-            f"Total Waste: {green_waste + yellow_waste + red_waste}\n\n"
-            f"Carried Waste: {carried_waste}\n\n"
-            f"Green Robots: {green_robots}\n"
-            f"Yellow Robots: {yellow_robots}\n"
-            f"Red Robots: {red_robots}\n"
-            f"Total Robots: {green_robots + yellow_robots + red_robots}"
+                    robot_offsets.append((sub_x, sub_y))
+                    robot_colors.append(ROBOT_COLORS[agent.color])
+                    tooltips[(sub_x, sub_y)] = tooltip(agent, model)
+                    # If carrying waste, draw the first carried waste slightly above the robot
+                    for waste_id in agent.knowledge['transporting']:
+                        waste_agent = model.get_agent_by_id(waste_id)
+                        if isinstance(waste_agent, WasteAgent):
+                            carried_offsets.append((sub_x, sub_y + 0.1))
+                            carried_colors.append(WASTE_COLORS[waste_agent.color])
+                            tooltips[(sub_x, sub_y + 0.1)] = tooltip(waste_agent, model)
+                            break
+
+        return Snapshot(
+            model=model,
+            step=model.current_step,
+            wastes=(_frozen_offsets(waste_offsets), tuple(waste_colors)),
+            robots=(_frozen_offsets(robot_offsets), tuple(robot_colors)),
+            carried=(_frozen_offsets(carried_offsets), tuple(carried_colors)),
+            tooltips=MappingProxyType(tooltips),
+            # the model's live counters, copied
+            stats=MappingProxyType(model.stats()),
         )
 
-        # Add a text box for statistics to the right of the grid
-        '''
-        if self.stats_text:
-            self.stats_text.remove() # Remove old stats text if it exists (for update)'''
-        self.stats_text = plt.figtext(0.70, 0.05, stats_text, fontsize=10,
-                   bbox=dict(facecolor='lightgray', alpha=0.5), verticalalignment='bottom')
+    def render(self, snapshot=None):
+        """
+        Draw a Snapshot (default: one of self.model taken now). Only the offsets and colors of the persistent
+        scatters change, they are drawn over the cached background and blitted, so the cost of a frame only grows
+        with the number of agents.
+        """
+        if snapshot is None:
+            snapshot = self.snapshot()
+        self.tooltips = snapshot.tooltips
+        self._set_points(self.waste_scatter, *snapshot.wastes)
+        self._set_points(self.robot_scatter, *snapshot.robots)
+        self._set_points(self.carried_scatter, *snapshot.carried)
+
+        stats = snapshot.stats
+        self.stats_text.set_text(
+            "STATISTICS\n\n"
+            f"Step: {snapshot.step}\n\n"
+            f"Green Waste: {stats['Green Waste']}\n"
+            f"Yellow Waste: {stats['Yellow Waste']}\n"
+            f"Red Waste: {stats['Red Waste']}\n"
+            f"Disposed Waste: {stats['Disposed Waste']}\n"
+            f"Total Waste: {stats['Total Waste']}\n\n"
+            f"Carried Waste: {stats['Carried Waste']}\n\n"
+            f"Green Robots: {stats['Green Robots']}\n"
+            f"Yellow Robots: {stats['Yellow Robots']}\n"
+            f"Red Robots: {stats['Red Robots']}\n"
+            f"Total Robots: {stats['Total Robots']}"
+        )
 
-        # Restore the view limits to maintain zoom level
-        self.ax.set_xlim(self.current_xlim)
-        self.ax.set_ylim(self.current_ylim)
+        self._blit()
 
-        # Update the display
-        self.fig.canvas.draw()
-        self.fig.canvas.flush_events()
-        plt.pause(0.001) # Reduced pause for smoother interaction
\ No newline at end of file
+    def _blit(self):
+        """Draw the animated artists over the cached background, or the whole figure if there is none"""
+        canvas = self.fig.canvas
+        if self.background is None or not canvas.supports_blit:
+            # full draw, the draw_event handler caches the background and draws the agents
+            canvas.draw()
+        else:
+            canvas.restore_region(self.background)
+            self._draw_animated()
+            canvas.blit(self.fig.bbox)
+        canvas.flush_events()
@@ -0,0 +1,143 @@
+"""
+  ____  __  __    _              _____    _        __  ____     __
+ / ___||  \/  |  / \            | ____|  / \      |  \/  \ \   / /
+ \___ \| |\/| | / _ \    _____  |  _|   / _ \     | |\/| |\ \ / / 
+  ___) | |  | |/ ___ \  |_____| | |___ / ___ \ _  | |  | | \ V /  
+ |____/|_|  |_/_/   \_\         |_____/_/   \_( ) |_|  |_|  \_/   
+                                              |/                  
+Authors:
+   Maxime Vanderbeken
+   Etienne Andrier
+
+Date : 2025-03-19
+
+License:
+   This file is open source and may be freely used and modified,
+   provided that proper credit is given to the original authors.
+"""
+import time
+import unittest
+from types import SimpleNamespace
+
+import numpy as np
+
+# why a run ended, index used as the b field of FINISH trace events
+TERMINATION_REASONS = ["finish_threshold", "max_steps", "no_progress", "idle", "wall_budget", "cpu_budget"]
+
+
+class NoProgress():
+    '''
+    Ends a run when no waste has been fused or disposed for steps steps. Picking wastes up and dropping them is not
+    progress, robots shuttling wastes around without fusing them do not keep a run alive.
+    '''
+    def __init__(self, steps):
+        self.steps = steps
+        self.counts = None
+        self.last_change = 0
+
+    def update(self, model):
+        counts = (model.disposed_waste_count, *model.waste_count.values())
+        if counts != self.counts:
+            self.counts = counts
+            self.last_change = model.current_step
+        elif model.current_step - self.last_change >= self.steps:
+            return "no_progress"
+        return None
+
+
+class IdleRobots():
+    '''
+    Ends a run when every robot has been idle or oscillating for steps steps: a robot is active on a step when it
+    reaches a cell other than the two it was on before, or when the number of wastes it carries changes.
+    Only keeps the two previous positions of each robot, O(robots) per step.
+    '''
+    def __init__(self, steps):
+        self.steps = steps
+        self.previous = None
+        self.last_active = 0
+
+    def update(self, model):
+        robots = model.robot_agents
+        current = np.array([(*robot.pos, len(robot.knowledge['transporting'])) for robot in robots]).reshape(-1, 3)
+        if self.previous is None or self.previous[0].shape != current.shape:
+            # first step, or robots were added
+            self.previous = (current, current)
+            self.last_active = model.current_step
+            return None
+        before, before_last = self.previous
+        moved = (current[:,:2] != before[:,:2]).any(axis=1) & (current[:,:2] != before_last[:,:2]).any(axis=1)
+        carried = current[:,2] != before[:,2]
+        if (moved | carried).any():
+            self.last_active = model.current_step
+        self.previous = (current, before)
+        if model.current_step - self.last_active >= self.steps:
+            return "idle"
+        return None
+
+
+class Budget():
+    '''
+    Ends a run once it has used wall_seconds of wall-clock time or cpu_seconds of process CPU time.
+    Time is accumulated between calls, so a run restored from a checkpoint keeps the budget it had left.
+    '''
+    def __init__(self, wall_seconds=None, cpu_seconds=None):
+        self.wall_seconds = wall_seconds
+        self.cpu_seconds = cpu_seconds
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.last = (time.perf_counter(), time.process_time())
+
+    def update(self, model):
+        now = (time.perf_counter(), time.process_time())
+        if self.last is not None:
+            # a forked process starts with no CPU time used
+            self.wall += max(now[0] - self.last[0], 0.0)
+            self.cpu += max(now[1] - self.last[1], 0.0)
+        self.last = now
+        if self.wall_seconds is not None and self.wall >= self.wall_seconds:
+            return "wall_budget"
+        if self.cpu_seconds is not None and self.cpu >= self.cpu_seconds:
+            return "cpu_budget"
+        return None
+
+    def __getstate__(self):
+        # clocks are per process
+        return {**self.__dict__, "last": None}
+
+
+class TestNoProgress(unittest.TestCase):
+    def make_model(self):
+        return SimpleNamespace(current_step=0, disposed_waste_count=0, carried_waste_count=0,
+                               waste_count={"green": 4, "yellow": 0, "red": 0})
+
+    def test_shuttling_is_not_progress(self):
+        model = self.make_model()
+        detector = NoProgress(10)
+        reasons = []
+        for step in range(12):
+            model.current_step = step
+            # a robot picks a waste up and drops it again, nothing is fused or disposed
+            model.carried_waste_count = step % 2
+            reasons.append(detector.update(model))
+        self.assertEqual(reasons[:10], [None] * 10)
+        self.assertEqual(reasons[10:], ["no_progress"] * 2)
+
+    def test_fusion_and_disposal_are_progress(self):
+        model = self.make_model()
+        detector = NoProgress(10)
+        for step in range(30):
+            model.current_step = step
+            if step % 8 == 0:
+                # two green wastes fused into a yellow one, or a red one disposed
+                model.waste_count["green"] -= 1
+                model.disposed_waste_count += step % 16 == 0
+            self.assertIsNone(detector.update(model))
+
+
+def main():
+    # Run the unit tests
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+"""
+  ____  __  __    _              _____    _        __  ____     __
+ / ___||  \/  |  / \            | ____|  / \      |  \/  \ \   / /
+ \___ \| |\/| | / _ \    _____  |  _|   / _ \     | |\/| |\ \ / / 
+  ___) | |  | |/ ___ \  |_____| | |___ / ___ \ _  | |  | | \ V /  
+ |____/|_|  |_/_/   \_\         |_____/_/   \_( ) |_|  |_|  \_/   
+                                              |/                  
+Authors:
+   Maxime Vanderbeken
+   Etienne Andrier
+
+Date : 2025-03-19
+
+License:
+   This file is open source and may be freely used and modified,
+   provided that proper credit is given to the original authors.
+"""
+import argparse
+import contextlib
+import cProfile
+import functools
+import io
+import itertools
+import os
+import pstats
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from .model import WasteRetrievalModel
+from .cache import load_summary
+from .checkpoint import load_checkpoint
+from .profiler import StepProfiler
+
+# WasteRetrievalModel keyword arguments that can be swept, with the type used to parse them on the command line
+SWEEP_PARAMETERS = {
+    "num_green": int,
+    "num_yellow": int,
+    "num_red": int,
+    "num_waste_green": int,
+    "num_waste_yellow": int,
+    "num_waste_red": int,
+    "width": int,
+    "height": int,
+    "seed": int,
+    "strategy": str,
+    "max_steps": int,
+    "finish_threshold": float,
+    "stream_every": int,
+    "engine": str,
+    "checkpoint_every": int,
+    "stall_steps": int,
+    "idle_steps": int,
+    "wall_budget": float,
+    "cpu_budget": float,
+}
+
+
+def expand_grid(grid):
+    '''
+    grid maps WasteRetrievalModel kwargs to a value or a list of values,
+    returns the list of kwargs dicts of the cartesian product
+    '''
+    names = list(grid)
+    values = [v if isinstance(v, (list, tuple)) else [v] for v in grid.values()]
+    return [dict(zip(names, combination)) for combination in itertools.product(*values)]
+
+
+def save_cprofile(profiler, run_dir):
+    '''stop profiler and save it to run_dir as cprofile.prof (pstats format) and the top functions as cprofile.txt'''
+    profiler.disable()
+    profiler.dump_stats(os.path.join(run_dir, "cprofile.prof"))
+    report = io.StringIO()
+    pstats.Stats(profiler, stream=report).sort_stats("cumulative").print_stats(40)
+    with open(os.path.join(run_dir, "cprofile.txt"), "w") as f:
+        f.write(report.getvalue())
+
+
+def run_model(params, quiet=True, profile=None):
+    '''
+    Build a WasteRetrievalModel from params and step it until check_finished() stops it.
+    profile="phases" saves the per phase timings of the run as profile.json in its run directory,
+    profile="cprofile" runs it under cProfile and saves cprofile.prof (pstats format) and the top functions as cprofile.txt.
+    If a run with the same config and code already completed under the same save_path, its saved summary is returned
+    (with cached=True) instead of running it again, if it was interrupted after saving a checkpoint it resumes from it.
+    '''
+    if profile not in (None, "phases", "cprofile"):
+        raise ValueError(f"Unknown profile mode {profile!r}, expected 'phases' or 'cprofile'")
+    if profile == "phases":
+        params = {**params, "profiler": StepProfiler(by_agent_type=True)}
+    profiler = cProfile.Profile() if profile == "cprofile" else None
+    start = time.perf_counter()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull if quiet else sys.stdout):
+        if profiler is not None:
+            profiler.enable()
+        model = WasteRetrievalModel(**params)
+        summary = load_summary(model.completed_run_dir())
+        if summary is not None:
+            if profiler is not None:
+                profiler.disable()
+            model.discard()
+            return {**summary, "elapsed": 0.0, "cached": True, "run_dir": model.completed_run_dir()}
+        if os.path.exists(model.checkpoint_path()):
+            checkpoint_path = model.checkpoint_path()
+            model.discard()
+            model = load_checkpoint(checkpoint_path)
+        if profiler is not None:
+            # saved by save_data into the run directory before it is published
+            model.save_hooks.append(functools.partial(save_cprofile, profiler))
+        while not model.finished:
+            model.step()
+    return {
+        "steps": model.current_step,
+        "termination": model.termination,
+        "elapsed": time.perf_counter() - start,
+        **model.stats(),
+        "cached": False,
+        "run_dir": model.get_run_dir(),
+    }
+
+
+def _run_one(index, params, quiet, profile=None):
+    '''Worker entry point, never raises so that one failing run does not take the sweep down'''
+    try:
+        return {"index": index, "status": "ok", "error": None, **params, **run_model(params, quiet, profile)}
+    except Exception:
+        return {"index": index, "status": "failed", "error": traceback.format_exc(), **params}
+
+
+def print_progress(done, total, result):
+    status = result["status"]
+    if status == "ok":
+        details = f"{result['steps']} steps ({result['termination']}), progress {result['Progress']:.2f}, {result['elapsed']:.1f}s"
+        if result["cached"]:
+            details += " (cached)"
+    else:
+        details = result["error"].strip().splitlines()[-1]
+    print(f"[{done}/{total}] run {result['index']} {status}: {details}", flush=True)
+
+
+def run_sweep(grid, workers=None, save_path="results/sweep/", quiet=True, progress=print_progress, profile=None):
+    '''
+    Run every combination of the kwargs in grid (see expand_grid) on a process pool, profiled as in run_model.
+    Each run saves its data in its own content addressed directory under save_path, so running the same sweep again
+    only runs the configurations that have no completed result yet, runs stopped by wall_budget or cpu_budget are
+    always run again (see cache.UNCACHED_TERMINATIONS). A run that raises
+    is reported as failed without stopping the others.
+    Returns a DataFrame with one row per run (parameters, status, steps and final stats),
+    also written to save_path/sweep.csv.
+    '''
+    runs = expand_grid(grid)
+    os.makedirs(save_path, exist_ok=True)
+    for params in runs:
+        params.setdefault("save_path", save_path)
+
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(_run_one, index, params, quiet, profile): index for index, params in enumerate(runs)}
+        for future in as_completed(futures):
+            index = futures[future]
+            try:
+                result = future.result()
+            except Exception:
+                # the worker process itself died
+                result = {"index": index, "status": "failed", "error": traceback.format_exc(), **runs[index]}
+            results.append(result)
+            if progress is not None:
+                progress(len(results), len(runs), result)
+
+    summary = pd.DataFrame(results).sort_values("index").set_index("index")
+    summary.to_csv(os.path.join(save_path, "sweep.csv"))
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a grid of WasteRetrievalModel configurations headlessly, in parallel.")
+    for name, type_ in SWEEP_PARAMETERS.items():
+        parser.add_argument(f"--{name}", type=type_, nargs="+", help=f"one or more values of {name}")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes (default: number of CPUs)")
+    parser.add_argument("--save_path", default="results/sweep/", help="directory receiving one sub-directory per configuration and sweep.csv, completed configurations are skipped")
+    parser.add_argument("--verbose", action="store_true", help="let the models print to the terminal")
+    parser.add_argument("--profile", choices=["phases", "cprofile"], default=None,
+                        help="save per phase timings (profile.json) or a cProfile report (cprofile.prof/.txt) in each run directory")
+    args = parser.parse_args(argv)
+
+    grid = {name: getattr(args, name) for name in SWEEP_PARAMETERS if getattr(args, name) is not None}
+    summary = run_sweep(grid, workers=args.workers, save_path=args.save_path, quiet=not args.verbose, profile=args.profile)
+    failed = (summary["status"] != "ok").sum()
+    print(f"{len(summary) - failed}/{len(summary)} runs finished, summary saved to {os.path.join(args.save_path, 'sweep.csv')}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,66 @@
+"""
+  ____  __  __    _              _____    _        __  ____     __
+ / ___||  \/  |  / \            | ____|  / \      |  \/  \ \   / /
+ \___ \| |\/| | / _ \    _____  |  _|   / _ \     | |\/| |\ \ / / 
+  ___) | |  | |/ ___ \  |_____| | |___ / ___ \ _  | |  | | \ V /  
+ |____/|_|  |_/_/   \_\         |_____/_/   \_( ) |_|  |_|  \_/   
+                                              |/                  
+Authors:
+   Maxime Vanderbeken
+   Etienne Andrier
+
+Date : 2025-03-19
+
+License:
+   This file is open source and may be freely used and modified,
+   provided that proper credit is given to the original authors.
+"""
+
+
+def sync_tag(step):
+    '''tag of the knowledge exchanged by the cluster merges at the start of a step'''
+    return 2 * step
+
+
+def observation_tag(step):
+    '''tag of the cells observed during a step, after that step's merges'''
+    return 2 * step + 1
+
+
+class ChangeLog():
+    '''
+    Where a robot's knowledge changed, as bounding boxes in grid coordinates tagged with sync_tag / observation_tag.
+
+    Writes with the same tag are coalesced into one box. When the log gets longer than max_entries its two oldest
+    boxes are fused under the newer of their tags: since() may then report a larger region than needed, never a smaller one.
+    '''
+    def __init__(self, max_entries=32):
+        self.max_entries = max_entries
+        self.entries = [] # [tag, x_min, x_max, y_min, y_max], increasing tags
+
+    def record(self, tag, x_min, x_max, y_min, y_max):
+        if self.entries and self.entries[-1][0] == tag:
+            self.entries[-1] = [tag] + _union(self.entries[-1][1:], [x_min, x_max, y_min, y_max])
+            return
+        self.entries.append([tag, x_min, x_max, y_min, y_max])
+        if len(self.entries) > self.max_entries:
+            oldest = self.entries.pop(0)
+            self.entries[0][1:] = _union(oldest[1:], self.entries[0][1:])
+
+    def since(self, tag):
+        '''(x_min, x_max, y_min, y_max) box of the cells written with a tag strictly greater than tag, None if none'''
+        box = None
+        for entry in reversed(self.entries):
+            if entry[0] <= tag:
+                break
+            box = entry[1:] if box is None else _union(box, entry[1:])
+        return box
+
+    def forget(self, tag):
+        '''drop the boxes tagged tag or earlier'''
+        while self.entries and self.entries[0][0] <= tag:
+            self.entries.pop(0)
+
+
+def _union(box1, box2):
+    return [min(box1[0], box2[0]), max(box1[1], box2[1]), min(box1[2], box2[2]), max(box1[3], box2[3])]
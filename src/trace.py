@@ -0,0 +1,80 @@
+"""
+  ____  __  __    _              _____    _        __  ____     __
+ / ___||  \/  |  / \            | ____|  / \      |  \/  \ \   / /
+ \___ \| |\/| | / _ \    _____  |  _|   / _ \     | |\/| |\ \ / / 
+  ___) | |  | |/ ___ \  |_____| | |___ / ___ \ _  | |  | | \ V /  
+ |____/|_|  |_/_/   \_\         |_____/_/   \_( ) |_|  |_|  \_/   
+                                              |/                  
+Authors:
+   Maxime Vanderbeken
+   Etienne Andrier
+
+Date : 2025-03-19
+
+License:
+   This file is open source and may be freely used and modified,
+   provided that proper credit is given to the original authors.
+"""
+import numpy as np
+import pandas as pd
+
+# levels, same values as the logging module
+DEBUG, INFO, WARNING = 10, 20, 30
+
+# categories of the traced events, with the meaning of the agent / a / b fields of their records
+PICKUP = 0    # robot picked up waste a
+DROP = 1      # robot dropped waste a, b is 1 if it was disposed
+FUSION = 2    # robot fused the waste b it carried into waste a, which took the next color
+MERGE = 3     # a cluster of a robots, robot being its first one, exchanged b cells (b teams joined with a blackboard)
+STATE = 4     # robot switched to state a (index in STATE_NAMES)
+FINISH = 5    # run finished, a is the number of disposed wastes, b the index of the reason in stall.TERMINATION_REASONS
+CHECKPOINT = 6  # the model was saved to its checkpoint_path()
+CATEGORY_NAMES = ["pickup", "drop", "fusion", "merge", "state", "finish", "checkpoint"]
+STATE_NAMES = ["FINDING_WASTE", "TRANSPORTING"]
+
+TRACE_DTYPE = np.dtype([("step", np.int64), ("level", np.uint8), ("category", np.uint8),
+                        ("agent", np.int64), ("a", np.int64), ("b", np.int64)])
+
+
+class Tracer():
+    '''
+    Structured event trace of a WasteRetrievalModel, pass it as WasteRetrievalModel(trace=Tracer(...)).
+
+    Events below level (DEBUG by default: everything, the agent events are DEBUG, FINISH and CHECKPOINT are INFO)
+    or outside categories (names of CATEGORY_NAMES, all by default) are dropped, the others are written as fixed
+    size records in a ring buffer of capacity events, so a long run keeps its last events in bounded memory.
+    The model and the agents only call emit() when model.trace is not None: a run without tracer pays one
+    attribute test per traced event and nothing else.
+    '''
+    def __init__(self, level=DEBUG, categories=None, capacity=1 << 16):
+        self.level = level
+        self.enabled = np.zeros(len(CATEGORY_NAMES), dtype=bool)
+        for name in (CATEGORY_NAMES if categories is None else categories):
+            self.enabled[CATEGORY_NAMES.index(name)] = True
+        self.records = np.zeros(capacity, dtype=TRACE_DTYPE)
+        self.count = 0 # number of events emitted, the ring holds the last min(count, capacity)
+
+    def emit(self, step, level, category, agent, a=-1, b=-1):
+        if level < self.level or not self.enabled[category]:
+            return
+        self.records[self.count % len(self.records)] = (step, level, category, agent, a, b)
+        self.count += 1
+
+    def events(self):
+        '''the events held by the ring, oldest first'''
+        capacity = len(self.records)
+        if self.count <= capacity:
+            return self.records[:self.count].copy()
+        start = self.count % capacity
+        return np.concatenate([self.records[start:], self.records[:start]])
+
+    def dump(self, path):
+        '''write the events held by the ring to path as a binary .npy file, read it back with load_trace'''
+        np.save(path, self.events())
+
+
+def load_trace(path):
+    '''DataFrame of a trace written by Tracer.dump, with the category names'''
+    events = pd.DataFrame(np.load(path))
+    events["category"] = np.array(CATEGORY_NAMES)[events["category"].to_numpy()]
+    return events
@@ -18,4 +18,8 @@ License:
 color_dict = {'green':0,'yellow':1,'red':2}
 direction_dict = {"NORTH":(0,1),"SOUTH":(0,-1),"WEST":(-1,0),"EAST":(1,0),"NORTHWEST":(-1,1),"NORTHEAST":(1,1),"SOUTHWEST":(-1,-1),"SOUTHEAST":(1,-1)}
 inv_direction_dict = {direction_dict[x]:x for x in direction_dict}
-robot_dict = {"random":"RobotAgent", "refined":"RefinedAgent"}
\ No newline at end of file
+#offsets of the 3x3 observation around a robot, in the order of mesa's get_neighborhood
+observation_offsets = [(x,y) for x in (-1,0,1) for y in (-1,0,1)]
+robot_dict = {"random":"RobotAgent", "refined":"RefinedAgent"}
+#highest radioactivity each robot color is allowed to walk on
+max_radioactivity_dict = {'green':1/3 - 1e-10,'yellow':2/3 - 1e-10,'red':2}
@@ -0,0 +1,246 @@
+"""
+  ____  __  __    _              _____    _        __  ____     __
+ / ___||  \/  |  / \            | ____|  / \      |  \/  \ \   / /
+ \___ \| |\/| | / _ \    _____  |  _|   / _ \     | |\/| |\ \ / / 
+  ___) | |  | |/ ___ \  |_____| | |___ / ___ \ _  | |  | | \ V /  
+ |____/|_|  |_/_/   \_\         |_____/_/   \_( ) |_|  |_|  \_/   
+                                              |/                  
+Authors:
+   Maxime Vanderbeken
+   Etienne Andrier
+
+Date : 2025-03-19
+
+License:
+   This file is open source and may be freely used and modified,
+   provided that proper credit is given to the original authors.
+"""
+import glob
+import json
+import os
+import queue
+import threading
+
+import numpy as np
+import pandas as pd
+
+from .variables import color_dict
+
+inv_color_dict = {color_dict[x]:x for x in color_dict}
+
+MODEL_COLUMNS = ["Green Waste", "Yellow Waste", "Red Waste", "Disposed Waste", "Progress"]
+
+# dtype of every column of every streamed table
+# "Removed" marks the step at which an agent left the model (fused waste), it is only used by change-only telemetry
+TABLES = {
+    "model": {"Step": np.int64, **{name: np.float64 if name == "Progress" else np.int64 for name in MODEL_COLUMNS}},
+    "agent_robot": {"Step": np.int64, "AgentID": np.int64, "Color": np.uint8,
+                    "Transporting 0": np.int64, "Transporting 1": np.int64, "X": np.int64, "Y": np.int64, "Removed": np.bool_},
+    "agent_waste": {"Step": np.int64, "AgentID": np.int64, "Color": np.uint8, "Picked Up": np.bool_, "Arrived": np.bool_,
+                    "Removed": np.bool_},
+}
+AGENT_TABLES = ["agent_robot", "agent_waste"]
+
+
+def robot_row(robot):
+    transporting = robot.knowledge['transporting']
+    return (color_dict[robot.color],
+            transporting[0] if len(transporting) > 0 else -1,
+            transporting[1] if len(transporting) > 1 else -1,
+            robot.pos[0], robot.pos[1], False)
+
+
+def waste_row(waste):
+    return (color_dict[waste.color], waste.picked_up, waste.arrived, False)
+
+
+class ChunkWriter():
+    '''
+    Streams the per step model and agent data of a run to run_dir as typed columnar .npz chunks.
+
+    Rows are buffered for flush_every steps, then handed to a background thread that writes
+    <table>_<chunk>.npz, so memory stays bounded on long runs, the step loop never waits on the disk
+    and everything up to the last flushed chunk survives a crash. Use load_table to read a table back.
+
+    With changes_only, an agent row is only written when one of its values differs from the last row
+    written for that agent (plus one "Removed" row when it leaves the model), load_table rebuilds the
+    dense per step view from it.
+    '''
+    def __init__(self, run_dir, flush_every=100, changes_only=False):
+        self.run_dir = run_dir
+        self.flush_every = flush_every
+        self.changes_only = changes_only
+        self.chunk_index = 0
+        self.buffered_steps = 0
+        self.columns = {table: {name: [] for name in TABLES[table]} for table in TABLES}
+        self.last_rows = {table: {} for table in AGENT_TABLES}
+        self.error = None
+        with open(os.path.join(run_dir, "telemetry.json"), "w") as f:
+            json.dump({"changes_only": changes_only, "flush_every": flush_every}, f)
+        self.queue = queue.Queue(maxsize=8)
+        self.thread = threading.Thread(target=self._write_loop, daemon=True)
+        self.thread.start()
+
+    def record(self, model):
+        '''Buffer the rows of the current step of model, flush if flush_every steps are buffered'''
+        if self.error is not None:
+            raise self.error
+        step = model.current_step
+        stats = model.stats()
+        model_columns = self.columns["model"]
+        model_columns["Step"].append(step)
+        for name in MODEL_COLUMNS:
+            model_columns[name].append(stats[name])
+
+        self._record_agents("agent_robot", step, model.robot_agents, robot_row)
+        self._record_agents("agent_waste", step, model.waste_agents, waste_row)
+
+        self.buffered_steps += 1
+        if self.buffered_steps >= self.flush_every:
+            self.flush()
+
+    def _record_agents(self, table, step, agents, make_row):
+        columns = self.columns[table]
+        names = list(TABLES[table])[2:]
+        if not self.changes_only:
+            for agent in agents:
+                self._append(columns, names, step, agent.unique_id, make_row(agent))
+            return
+
+        last_rows = self.last_rows[table]
+        current_rows = {}
+        for agent in agents:
+            row = make_row(agent)
+            current_rows[agent.unique_id] = row
+            if last_rows.get(agent.unique_id) != row:
+                self._append(columns, names, step, agent.unique_id, row)
+        for agent_id in last_rows.keys() - current_rows.keys():
+            self._append(columns, names, step, agent_id, last_rows[agent_id][:-1] + (True,))
+        self.last_rows[table] = current_rows
+
+    def _append(self, columns, names, step, agent_id, row):
+        columns["Step"].append(step)
+        columns["AgentID"].append(agent_id)
+        for name, value in zip(names, row):
+            columns[name].append(value)
+
+    def flush(self):
+        '''Convert the buffered rows to typed arrays and queue them for writing'''
+        if self.buffered_steps == 0:
+            return
+        for table, columns in self.columns.items():
+            arrays = {name: np.asarray(values, dtype=TABLES[table][name]) for name, values in columns.items()}
+            self.queue.put((f"{table}_{self.chunk_index:06d}.npz", arrays))
+            self.columns[table] = {name: [] for name in TABLES[table]}
+        self.chunk_index += 1
+        self.buffered_steps = 0
+
+    def close(self):
+        '''Flush what is left and wait for every chunk to be on disk'''
+        self.flush()
+        self.queue.put(None)
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+    def drain(self):
+        '''Wait until every queued chunk is on disk'''
+        self.queue.join()
+        if self.error is not None:
+            raise self.error
+
+    def reopen(self, run_dir):
+        '''
+        Continue writing to run_dir with a new writer thread. Used by forked branches, which do not inherit the
+        thread of their parent: the parent drains its queue before forking and the branch copies its chunks to run_dir.
+        '''
+        self.run_dir = run_dir
+        self.__setstate__({})
+
+    def __getstate__(self):
+        '''
+        Pickled with a model checkpoint: the rows not flushed yet and the chunk index are kept, the queued chunks
+        are written first so that every chunk before chunk_index is on disk when the checkpoint is.
+        '''
+        self.drain()
+        state = self.__dict__.copy()
+        del state["queue"], state["thread"]
+        return state
+
+    def __setstate__(self, state):
+        '''
+        Restored from a checkpoint (or reopened): the chunks written after the checkpoint was taken are removed,
+        they are written again, possibly with other boundaries, as the run continues.
+        '''
+        self.__dict__.update(state)
+        for table in TABLES:
+            for path in glob.glob(os.path.join(self.run_dir, f"{table}_*.npz")):
+                if int(os.path.basename(path)[len(table) + 1:-len(".npz")]) >= self.chunk_index:
+                    os.remove(path)
+        self.queue = queue.Queue(maxsize=8)
+        self.thread = threading.Thread(target=self._write_loop, daemon=True)
+        self.thread.start()
+
+    def _write_loop(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                self.queue.task_done()
+                return
+            if self.error is not None:
+                self.queue.task_done()
+                continue
+            file_name, arrays = item
+            try:
+                # write then rename so that a crash never leaves a truncated chunk behind
+                tmp_path = os.path.join(self.run_dir, file_name + ".tmp")
+                with open(tmp_path, "wb") as f:
+                    np.savez(f, **arrays)
+                os.replace(tmp_path, os.path.join(self.run_dir, file_name))
+            except Exception as e:
+                self.error = e
+            self.queue.task_done()
+
+
+def densify(data, last_step):
+    '''
+    Rebuild the dense per step view of a change-only agent table: every agent gets one row per step
+    from its first row up to last_step, or up to the step before it was removed.
+    '''
+    if data.empty:
+        return data.drop(columns="Removed")
+    dtypes = data.dtypes
+    steps = np.arange(data.index.get_level_values("Step").min(), last_step + 1)
+    agent_ids = data.index.get_level_values("AgentID").unique()
+    full_index = pd.MultiIndex.from_product([steps, agent_ids], names=["Step", "AgentID"])
+    dense = data.reindex(full_index).groupby(level="AgentID").ffill()
+    dense = dense[dense["Removed"].notna() & ~dense["Removed"].astype(bool)]
+    return dense.astype(dtypes).drop(columns="Removed")
+
+
+def load_table(run_dir, table, dense=True):
+    '''
+    Read back a table streamed by ChunkWriter ("model", "agent_robot" or "agent_waste") as a DataFrame.
+    Change-only agent tables are expanded to one row per agent and step unless dense is False.
+    '''
+    paths = sorted(glob.glob(os.path.join(run_dir, f"{table}_*.npz")))
+    columns = {name: [] for name in TABLES[table]}
+    for path in paths:
+        with np.load(path) as chunk:
+            for name in columns:
+                columns[name].append(chunk[name])
+    data = pd.DataFrame({name: np.concatenate(values) if values else np.array([], dtype=TABLES[table][name])
+                         for name, values in columns.items()})
+    index = ["Step", "AgentID"] if "AgentID" in data else ["Step"]
+    data = data.set_index(index)
+    if table in AGENT_TABLES:
+        with open(os.path.join(run_dir, "telemetry.json")) as f:
+            changes_only = json.load(f)["changes_only"]
+        if changes_only and dense:
+            last_step = load_table(run_dir, "model").index.max()
+            data = densify(data, last_step)
+        elif not changes_only:
+            data = data.drop(columns="Removed")
+    if "Color" in data:
+        data["Color"] = data["Color"].map(inv_color_dict)
+    return data
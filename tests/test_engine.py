@@ -0,0 +1,55 @@
+import contextlib
+import io
+import tempfile
+import unittest
+
+import numpy as np
+
+from src.engine import ArrayEngine
+from src.model import WasteRetrievalModel
+
+
+class TestArrayEngine(unittest.TestCase):
+    PARAMS = dict(width=21, height=21, num_green=3, num_yellow=2, num_red=2, num_waste_green=12)
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.save_path = directory.name
+
+    def run_model(self, seed, engine, strategy, max_steps):
+        with contextlib.redirect_stdout(io.StringIO()):
+            model = WasteRetrievalModel(seed=seed, engine=engine, strategy=strategy, max_steps=max_steps,
+                                        save_path=self.save_path, **self.PARAMS)
+            trajectory = []
+            while not model.finished:
+                model.step()
+                trajectory.append([(*robot.pos, *robot.knowledge['transporting']) for robot in model.robot_agents])
+        return model, trajectory
+
+    def test_same_seed_same_trajectory(self):
+        for strategy in ('random', 'refined'):
+            _, first = self.run_model(3, 'arrays', strategy, 80)
+            _, second = self.run_model(3, 'arrays', strategy, 80)
+            self.assertEqual(first, second)
+
+    def test_close_to_objects_over_fixed_seeds(self):
+        # same policy, different random draws: compared on average over seeds, with a fixed tolerance
+        steps, progress = {}, {}
+        for engine in ('objects', 'arrays'):
+            models = [self.run_model(seed, engine, 'refined', 400)[0] for seed in range(8)]
+            steps[engine] = np.mean([model.current_step for model in models])
+            progress[engine] = np.mean([model.calculate_progress() for model in models])
+        self.assertLessEqual(abs(progress['arrays'] - progress['objects']), 0.15)
+        self.assertLessEqual(abs(steps['arrays'] - steps['objects']), 0.25 * steps['objects'])
+
+    def test_knowledge_memory_is_bounded(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            model = WasteRetrievalModel(seed=0, width=30, height=30, strategy='refined', save_path=self.save_path)
+        model.width, model.height = 30000, 30000
+        with self.assertRaises(ValueError):
+            ArrayEngine(model)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,38 @@
+import contextlib
+import io
+import tempfile
+import unittest
+
+import numpy as np
+
+from src.model import WasteRetrievalModel, seed_entropy
+
+
+class TestSeed(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.save_path = directory.name
+
+    def make_model(self, seed):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return WasteRetrievalModel(seed=seed, save_path=self.save_path)
+
+    def test_text_of_an_integer_is_that_integer(self):
+        # the seed field of the app sends text once it is edited
+        self.assertEqual(self.make_model("42").seed, 42)
+        np.testing.assert_array_equal(self.make_model("42").radioactivity, self.make_model(42).radioactivity)
+
+    def test_any_seed_is_accepted_and_reproducible(self):
+        for seed in ("abc", "", -3, 1.5):
+            first, second = self.make_model(seed), self.make_model(seed)
+            self.assertEqual(first.seed, second.seed)
+            np.testing.assert_array_equal(first.radioactivity, second.radioactivity)
+
+    def test_sequences_are_kept(self):
+        self.assertEqual(seed_entropy([5, 0, 2]), [5, 0, 2])
+        self.assertIsNone(seed_entropy(None))
+
+
+if __name__ == "__main__":
+    unittest.main()